@@ -1,5 +1,7 @@
 from app import app
 from app.models import Artist, Venue, Show, ArtistGenres, VenueGenres
 from app.routes import *
+from app.api import *
+from app.commands import *
 from app.custom_enum import GenreEnum, StateEnum
 from app.forms import ArtistForm, VenueForm, ShowForm
\ No newline at end of file
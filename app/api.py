@@ -0,0 +1,312 @@
+from datetime import datetime
+
+from flask import abort, jsonify, request
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import load_only, undefer
+
+from app.app import app, cache, db
+from app.exporter import SHOW_FIELDS
+from app.importer import parse_starttime
+from app.models import Artist, ArtistGenres, Show, Venue, VenueGenres, \
+                       refresh_show_stats, split_shows, touch_catalog
+from app.pagination import get_flag_arg, get_page_args, paginate
+from app.routes import show_namespaces
+
+
+API_PREFIX = '/api/v1'
+
+# model, genre model, foreign key, counterpart model and prefix, columns
+RESOURCES = {
+    'venues': (Venue, VenueGenres, 'venue_id', Artist, 'artist',
+               ['id', 'name', 'city', 'state', 'address', 'phone',
+                'image_link', 'facebook_link', 'website', 'seeking_talent',
+                'seeking_description']),
+    'artists': (Artist, ArtistGenres, 'artist_id', Venue, 'venue',
+                ['id', 'name', 'city', 'state', 'phone', 'image_link',
+                 'facebook_link', 'website', 'seeking_venue',
+                 'seeking_description']),
+}
+RELATION_FIELDS = ['past_shows', 'upcoming_shows', 'past_shows_count',
+                   'upcoming_shows_count']
+
+
+#----------------------------------------------------------------------------#
+# Request arguments
+#----------------------------------------------------------------------------#
+
+
+def get_fields(columns):
+    """Parse `fields=` and `include=` into the set of fields to return."""
+    includes = set(filter(None, request.args.get('include', '').split(',')))
+    if includes - {'shows'}:
+        abort(400, 'include= only supports shows')
+
+    allowed = columns + ['genres', 'num_upcoming_shows']
+    if 'shows' in includes:
+        allowed = allowed + RELATION_FIELDS
+    fields = request.args.get('fields')
+    if not fields:
+        return set(allowed)
+
+    fields = set(fields.split(','))
+    unknown = fields - set(allowed)
+    if unknown:
+        abort(400, f'unknown fields: {", ".join(sorted(unknown))}')
+    return fields | {'id'}
+
+
+#----------------------------------------------------------------------------#
+# Batched relation loading
+#----------------------------------------------------------------------------#
+
+
+def load_genres(genre_model, key, ids):
+    genres = {entity_id: [] for entity_id in ids}
+    rows = (db.session.query(getattr(genre_model, key), genre_model.genre)
+            .filter(getattr(genre_model, key).in_(ids)))
+    for entity_id, genre in rows:
+        genres[entity_id].append(str(genre))
+    return genres
+
+
+def load_shows(key, counterpart, prefix, ids):
+    """Shows of all `ids` from one IN query, split like to_dict does."""
+    counterpart_key = f'{prefix}_id'
+    rows = (db.session.query(
+                getattr(Show, key).label('owner_id'),
+                Show.starttime,
+                counterpart.id,
+                counterpart.name,
+                counterpart.image_link)
+            .select_from(Show)
+            .join(counterpart, counterpart.id ==
+                  getattr(Show, counterpart_key))
+            .filter(getattr(Show, key).in_(ids))
+            .order_by(Show.starttime))
+
+    shows = {entity_id: [] for entity_id in ids}
+    for row in rows:
+        shows[row.owner_id].append(row)
+
+    now = datetime.now()
+    result = {}
+    for entity_id, entity_shows in shows.items():
+        past_shows, upcoming_shows = split_shows(entity_shows, now)
+        past, upcoming = [[{
+            f'{prefix}_id': show.id,
+            f'{prefix}_name': show.name,
+            f'{prefix}_image_link': show.image_link,
+            'start_time': show.starttime.isoformat() + 'Z'
+        } for show in part] for part in (past_shows, upcoming_shows)]
+        result[entity_id] = {
+            'past_shows': past,
+            'upcoming_shows': upcoming,
+            'past_shows_count': len(past),
+            'upcoming_shows_count': len(upcoming)
+        }
+    return result
+
+
+def serialize(kind, entities, fields):
+    model, genre_model, key, counterpart, prefix, columns = RESOURCES[kind]
+    ids = [entity.id for entity in entities]
+    genres = load_genres(genre_model, key, ids) if 'genres' in fields \
+        else {}
+    shows = load_shows(key, counterpart, prefix, ids) \
+        if fields & set(RELATION_FIELDS) else {}
+
+    data = []
+    for entity in entities:
+        item = {}
+        for field in columns + ['num_upcoming_shows']:
+            if field in fields:
+                value = getattr(entity, field)
+                item[field] = str(value) if field == 'state' else value
+        if 'genres' in fields:
+            item['genres'] = genres[entity.id]
+        for field in RELATION_FIELDS:
+            if field in fields:
+                item[field] = shows[entity.id][field]
+        data.append(item)
+    return data
+
+
+def entity_query(kind, fields):
+    model, _, _, _, _, columns = RESOURCES[kind]
+    query = model.query.options(
+        load_only(*[c for c in columns if c in fields or c == 'name']))
+    if 'num_upcoming_shows' in fields:
+        query = query.options(undefer('num_upcoming_shows'))
+    return query
+
+
+#----------------------------------------------------------------------------#
+# Venues and Artists
+#----------------------------------------------------------------------------#
+
+
+@app.route(f'{API_PREFIX}/<any(venues, artists):kind>')
+def api_list(kind):
+    model = RESOURCES[kind][0]
+    fields = get_fields(RESOURCES[kind][5])
+    page = paginate(entity_query(kind, fields), [model.name, model.id],
+                    lambda e: (e.name, e.id), **get_page_args())
+
+    return jsonify({
+        'data': serialize(kind, page.items, fields),
+        'next': page.next_cursor,
+        'prev': page.prev_cursor
+    })
+
+
+@app.route(f'{API_PREFIX}/<any(venues, artists):kind>/<int:entity_id>')
+def api_detail(kind, entity_id):
+    model = RESOURCES[kind][0]
+    fields = get_fields(RESOURCES[kind][5])
+    entity = (entity_query(kind, fields).filter(model.id == entity_id)
+              .first_or_404())
+
+    return jsonify({'data': serialize(kind, [entity], fields)[0]})
+
+
+#----------------------------------------------------------------------------#
+# Shows
+#----------------------------------------------------------------------------#
+
+
+@app.route(f'{API_PREFIX}/shows')
+def api_shows():
+    upcoming = get_flag_arg('upcoming')
+    page = Show.get_show_infos(upcoming=upcoming, **get_page_args())
+    fields = set(SHOW_FIELDS)
+    if request.args.get('fields'):
+        fields = set(request.args['fields'].split(','))
+        unknown = fields - set(SHOW_FIELDS)
+        if unknown:
+            abort(400, f'unknown fields: {", ".join(sorted(unknown))}')
+    data = [{k: v for k, v in item.items() if k in fields}
+            for item in page.items]
+
+    return jsonify({
+        'data': data,
+        'next': page.next_cursor,
+        'prev': page.prev_cursor
+    })
+
+
+def parse_id(value):
+    # int() would also take true as 1 and truncate 1.7 to 1
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.isascii() and value.isdigit():
+        return int(value)
+    raise ValueError(f'expected an integer, got {value!r}')
+
+
+def parse_show(item):
+    """Return the (venue_id, artist_id, starttime) key of a batch item."""
+    if not isinstance(item, dict):
+        raise ValueError('expected an object')
+    try:
+        venue_id = parse_id(item['venue_id'])
+        artist_id = parse_id(item['artist_id'])
+    except (KeyError, ValueError):
+        raise ValueError('venue_id and artist_id must be integers')
+    try:
+        starttime = parse_starttime(item['start_time'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('start_time must be an ISO 8601 date and time')
+    return venue_id, artist_id, starttime
+
+
+def validate_shows(items):
+    """Check a batch with one query per table instead of one per item.
+
+    Returns the keys of the shows to insert and a list of per-item errors.
+    """
+    keys, errors = {}, []
+    for index, item in enumerate(items):
+        try:
+            keys[index] = parse_show(item)
+        except ValueError as e:
+            errors.append({'index': index, 'error': str(e)})
+    if not keys:
+        return [], errors
+
+    venue_ids = {key[0] for key in keys.values()}
+    artist_ids = {key[1] for key in keys.values()}
+    starttimes = {key[2] for key in keys.values()}
+    known_venues = {venue_id for venue_id, in db.session.query(Venue.id)
+                    .filter(Venue.id.in_(venue_ids))}
+    known_artists = {artist_id for artist_id, in db.session.query(Artist.id)
+                     .filter(Artist.id.in_(artist_ids))}
+    # the IN lists over-select; exact key matches are picked out below
+    existing = set(db.session.query(Show.venue_id, Show.artist_id,
+                                    Show.starttime)
+                   .filter(Show.venue_id.in_(venue_ids),
+                           Show.artist_id.in_(artist_ids),
+                           Show.starttime.in_(starttimes)))
+
+    seen = set()
+    for index, key in keys.items():
+        venue_id, artist_id, _ = key
+        if venue_id not in known_venues:
+            error = f'there is no venue with ID {venue_id}'
+        elif artist_id not in known_artists:
+            error = f'there is no artist with ID {artist_id}'
+        elif key in existing:
+            error = 'the show is already listed'
+        elif key in seen:
+            error = 'the show appears more than once in the batch'
+        else:
+            seen.add(key)
+            continue
+        errors.append({'index': index, 'error': error})
+    errors.sort(key=lambda error: error['index'])
+    return sorted(seen), errors
+
+
+@app.route(f'{API_PREFIX}/shows/batch', methods=['POST'])
+def api_create_shows():
+    """Create many shows in one transaction.
+
+    The batch is all or nothing: if any item is invalid no show is
+    created and every error is reported with the index of its item.
+    """
+    items = request.get_json(silent=True)
+    if isinstance(items, dict):
+        items = items.get('shows')
+    if not isinstance(items, list) or not items:
+        abort(400, 'expected a non-empty list of shows')
+    if len(items) > app.config['SHOW_BATCH_LIMIT']:
+        abort(400, f'at most {app.config["SHOW_BATCH_LIMIT"]} shows '
+                   'per batch')
+
+    keys, errors = validate_shows(items)
+    if errors:
+        return jsonify({'errors': errors}), 400
+
+    now = datetime.utcnow()
+    try:
+        touch_catalog()
+        db.session.execute(Show.__table__.insert(), [{
+            'venue_id': venue_id,
+            'artist_id': artist_id,
+            'starttime': starttime,
+            'updated_at': now
+        } for venue_id, artist_id, starttime in keys])
+        refresh_show_stats(venue_ids={key[0] for key in keys},
+                           artist_ids={key[1] for key in keys})
+        db.session.commit()
+    except IntegrityError:
+        # a concurrent request listed one of the shows first
+        db.session.rollback()
+        abort(409, 'some of the shows were listed concurrently, '
+                   'please retry')
+
+    namespaces = set()
+    for venue_id, artist_id, _ in keys:
+        namespaces.update(show_namespaces(venue_id, artist_id))
+    cache.invalidate(*namespaces)
+
+    return jsonify({'created': len(keys)}), 201
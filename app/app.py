@@ -5,13 +5,22 @@
 import babel
 import dateutil.parser
 import logging
+import os
+from datetime import datetime
+from functools import lru_cache
 
+from babel import Locale
+from babel.dates import LC_TIME, UTC, parse_pattern
 from flask import Flask
 from flask_migrate import Migrate
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 from logging import Formatter, FileHandler
 
+from app.cache import Cache, FragmentCache
+from app.dbpool import PooledSQLAlchemy
+from app.metrics import Metrics
+from app.profiling import Profiler
+
 
 #----------------------------------------------------------------------------#
 # App Config.
@@ -20,9 +29,13 @@ from logging import Formatter, FileHandler
 
 app = Flask(__name__)
 moment = Moment(app)
-app.config.from_object('app.config')
-db = SQLAlchemy(app)
+app.config.from_object(os.environ.get('APP_CONFIG', 'app.config'))
+db = PooledSQLAlchemy(app)
 migrate = Migrate(app, db)
+cache = Cache(app)
+fragments = FragmentCache(app)
+profiler = Profiler(app)
+metrics = Metrics(app)
 
 
 #----------------------------------------------------------------------------#
@@ -30,13 +43,40 @@ migrate = Migrate(app, db)
 #----------------------------------------------------------------------------#
 
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format)
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+
+@lru_cache(maxsize=None)
+def get_datetime_pattern(format, locale):
+    # parsed once per (format, locale) instead of on every call
+    return parse_pattern(DATETIME_FORMATS.get(format, format)), \
+        Locale.parse(locale)
+
+
+def parse_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    try:
+        # the models render start times as isoformat() + 'Z'
+        return datetime.fromisoformat(value[:-1] if value.endswith('Z')
+                                      else value)
+    except ValueError:
+        return dateutil.parser.parse(value)
+
+
+# a show listing formats one value per show; keep a whole page cached
+@lru_cache(maxsize=16384)
+def format_datetime(value, format='medium', locale=LC_TIME):
+    date = parse_datetime(value)
+    if format in ('long', 'short'):
+        return babel.dates.format_datetime(date, format, locale=locale)
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=UTC)
+    pattern, locale = get_datetime_pattern(format, locale)
+    return pattern.apply(date, locale)
 
 
 app.jinja_env.filters['datetime'] = format_datetime
@@ -0,0 +1,317 @@
+"""ASGI entry point.
+
+Venue and artist detail pages are served by async handlers that load the
+entity, its genres and its shows concurrently over asyncpg; every other
+request is handed to the Flask app, which runs in a thread pool.
+
+    uvicorn app.asgi:application --workers 4
+
+Needs `asgiref`, and `asyncpg` for the async handlers; without asyncpg
+all requests go to the Flask app.
+"""
+import asyncio
+import random
+import re
+import time
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi
+from flask import render_template
+from werkzeug.http import http_date, parse_etags, quote_etag
+
+from app.app import app, cache, metrics, profiler
+from app.conditional import last_modified, make_etag
+from app.importer import ENTITIES
+from app.profiling import add_statement
+from app.routes import until_next_upcoming_show
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+
+DETAIL_PATH = re.compile(r'^/(venues|artists)/(\d+)$')
+
+# entity kind: (template variable, counterpart kind, Flask endpoint)
+DETAIL_PAGES = {
+    'venues': ('venue', 'artists', 'show_venue'),
+    'artists': ('artist', 'venues', 'show_artist'),
+}
+
+
+#----------------------------------------------------------------------------#
+# Queries
+#----------------------------------------------------------------------------#
+
+
+def detail_queries(kind):
+    """SQL for the page version (like Venue.get_version), the entity, its
+    genres and its shows with their counterparts."""
+    model, genre_model, key, fields = ENTITIES[kind]
+    counterpart = ENTITIES[DETAIL_PAGES[kind][1]][0]
+    counterpart_key = ENTITIES[DETAIL_PAGES[kind][1]][2]
+    columns = ', '.join(f'"{field}"' for field in ['id'] + fields)
+    return (
+        f'SELECT e.updated_at, max(s.updated_at), max(c.updated_at), '
+        f'count(s.starttime), '
+        f'count(CASE WHEN s.starttime > $2 THEN 1 END) '
+        f'FROM "{model.__tablename__}" e '
+        f'LEFT OUTER JOIN "Show" s ON s.{key} = e.id '
+        f'LEFT OUTER JOIN "{counterpart.__tablename__}" c '
+        f'ON c.id = s.{counterpart_key} '
+        f'WHERE e.id = $1 GROUP BY e.id',
+        f'SELECT {columns} FROM "{model.__tablename__}" WHERE id = $1',
+        f'SELECT genre FROM "{genre_model.__tablename__}" '
+        f'WHERE {key} = $1',
+        f'SELECT s.starttime, c.id, c.name, c.image_link '
+        f'FROM "Show" s JOIN "{counterpart.__tablename__}" c '
+        f'ON c.id = s.{counterpart_key} '
+        f'WHERE s.{key} = $1 ORDER BY s.starttime')
+
+
+QUERIES = {kind: detail_queries(kind) for kind in DETAIL_PAGES}
+
+
+class Request:
+    """What one async request records for the metrics and the profiler."""
+
+    def __init__(self, scope, endpoint):
+        self.start = time.perf_counter()
+        self.method = scope['method']
+        self.full_path = scope['path'] + '?' + \
+            scope['query_string'].decode('utf-8', 'replace')
+        self.endpoint = endpoint
+        self.profile = profiler.new_profile() if profiler.enabled else None
+
+    async def fetch(self, pool, method, sql, *args):
+        """Run `method` ('fetch', 'fetchrow') of a pool, timed."""
+        start = time.perf_counter()
+        result = await getattr(pool, method)(sql, *args)
+        elapsed = time.perf_counter() - start
+        metrics.record_statement(self.endpoint, elapsed)
+        if self.profile is not None:
+            add_statement(self.profile, sql, elapsed)
+        return result
+
+    def finish(self, status):
+        """Record the request; returns the profiling headers, if any."""
+        duration = time.perf_counter() - self.start
+        metrics.record_request(self.endpoint, self.method, status, duration)
+        if self.profile is None:
+            return {}
+        profiler.record(self.profile, self.endpoint, self.method,
+                        self.full_path)
+        return profiler.headers(self.profile, duration)
+
+
+async def load_version(request, pool, kind, entity_id):
+    version = await request.fetch(pool, 'fetchrow', QUERIES[kind][0],
+                                  entity_id, datetime.now())
+    return tuple(version) if version is not None else None
+
+
+async def load_detail(request, pool, kind, entity_id):
+    """The to_dict() of a venue or artist from three concurrent queries."""
+    _, entity_sql, genres_sql, shows_sql = QUERIES[kind]
+    entity, genres, shows = await asyncio.gather(
+        request.fetch(pool, 'fetchrow', entity_sql, entity_id),
+        request.fetch(pool, 'fetch', genres_sql, entity_id),
+        request.fetch(pool, 'fetch', shows_sql, entity_id))
+    if entity is None:
+        return None
+
+    prefix = DETAIL_PAGES[DETAIL_PAGES[kind][1]][0]
+    now = datetime.now()
+    data = dict(entity)
+    data['genres'] = [row['genre'] for row in genres]
+    past, upcoming = [], []
+    for row in shows:
+        (upcoming if row['starttime'] > now else past).append({
+            f'{prefix}_id': row['id'],
+            f'{prefix}_name': row['name'],
+            f'{prefix}_image_link': row['image_link'],
+            'start_time': row['starttime'].isoformat() + 'Z'
+        })
+    data.update({
+        'past_shows': past,
+        'upcoming_shows': upcoming,
+        'past_shows_count': len(past),
+        'upcoming_shows_count': len(upcoming)
+    })
+    return data
+
+
+#----------------------------------------------------------------------------#
+# Rendering
+#----------------------------------------------------------------------------#
+
+
+# The page cache and Jinja block, so they run in the thread pool rather
+# than on the event loop. Each call pushes its own request context, which
+# never spans an await.
+
+
+def render_page(request, name, data):
+    start = time.perf_counter()
+    with app.test_request_context(request.full_path,
+                                  method=request.method):
+        if data is None:
+            body = render_template('errors/404.html')
+        else:
+            body = render_template(f'pages/show_{name}.html',
+                                   **{name: data})
+    if request.profile is not None:
+        request.profile['template_time'] += time.perf_counter() - start
+    return body.encode()
+
+
+def render_cached(request, name, entity_id, version):
+    """The page rendered from cached data of `version`, or None."""
+    found, data = cache.get(f'{name}:{entity_id}', 'detail', version)
+    return render_page(request, name, data) if found else None
+
+
+def store_and_render(request, name, entity_id, version, data):
+    if data is not None:
+        cache.set(f'{name}:{entity_id}', 'detail', data,
+                  ttl=until_next_upcoming_show, version=version)
+    return render_page(request, name, data)
+
+
+render_cached_async = sync_to_async(render_cached, thread_sensitive=False)
+store_and_render_async = sync_to_async(store_and_render,
+                                       thread_sensitive=False)
+render_page_async = sync_to_async(render_page, thread_sensitive=False)
+
+
+#----------------------------------------------------------------------------#
+# Application
+#----------------------------------------------------------------------------#
+
+
+def headers_of(scope):
+    return {name.decode('latin-1'): value.decode('latin-1')
+            for name, value in scope['headers']}
+
+
+def asyncpg_dsn(url):
+    # asyncpg takes plain postgres:// URLs, without a driver name
+    return re.sub(r'^postgres(ql)?(\+\w+)?://', 'postgresql://', url)
+
+
+class AsyncApp:
+    """ASGI app that serves detail pages itself and the rest via Flask."""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        self.primary = None
+        self.replicas = []
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] == 'http' and self.primary is not None and \
+                scope['method'] in ('GET', 'HEAD'):
+            match = DETAIL_PATH.match(scope['path'])
+            if match and self.handles(headers_of(scope)):
+                return await self.detail(scope, send, match.group(1),
+                                         int(match.group(2)))
+        return await self.wsgi(scope, receive, send)
+
+    def handles(self, headers):
+        # requests with a session (flash messages, replica stickiness) are
+        # left to the Flask views
+        cookie = self.flask_app.session_cookie_name + '='
+        return cookie not in headers.get('cookie', '')
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self.startup()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for pool in [self.primary] + self.replicas:
+                    if pool is not None:
+                        await pool.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def startup(self):
+        config = self.flask_app.config
+        if asyncpg is None:
+            self.flask_app.logger.warning(
+                'asyncpg is not installed, serving every page through Flask')
+            return
+        engine_options = config['SQLALCHEMY_ENGINE_OPTIONS']
+        max_size = engine_options.get('pool_size', 5) + \
+            engine_options.get('max_overflow', 10)
+        self.primary = await asyncpg.create_pool(
+            asyncpg_dsn(config['SQLALCHEMY_DATABASE_URI']),
+            min_size=1, max_size=max_size)
+        for bind in config['REPLICA_BINDS']:
+            self.replicas.append(await asyncpg.create_pool(
+                asyncpg_dsn(config['SQLALCHEMY_BINDS'][bind]),
+                min_size=1, max_size=max_size))
+
+    async def detail(self, scope, send, kind, entity_id):
+        name, _, endpoint = DETAIL_PAGES[kind]
+        request = Request(scope, endpoint)
+        metrics.counters.inc('http_requests_in_flight')
+        try:
+            status, headers, body = await self.respond(
+                request, headers_of(scope), kind, name, entity_id)
+        finally:
+            metrics.counters.inc('http_requests_in_flight', amount=-1)
+        headers.update(request.finish(status))
+
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(key.lower().encode('latin-1'),
+                         value.encode('latin-1'))
+                        for key, value in headers.items()]
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': body if scope['method'] == 'GET' else b''
+        })
+
+    async def respond(self, request, request_headers, kind, name,
+                      entity_id):
+        """Like the conditional Flask view: (status, headers, body)."""
+        # read like any GET, from a replica if there are any; data cached
+        # under the version is as recent as the version itself
+        pool = random.choice(self.replicas or [self.primary])
+        version = await load_version(request, pool, kind, entity_id)
+        if version is None:
+            body = await render_page_async(request, name, None)
+            return 404, self.content_headers(body), body
+
+        etag = make_etag(request.full_path, version)
+        headers = {'ETag': quote_etag(etag), 'Cache-Control': 'no-cache'}
+        modified = last_modified(version)
+        if modified is not None:
+            headers['Last-Modified'] = http_date(modified)
+        if parse_etags(request_headers.get('if-none-match')).contains(etag):
+            return 304, headers, b''
+
+        body = await render_cached_async(request, name, entity_id, version)
+        if body is None:
+            data = await load_detail(request, pool, kind, entity_id)
+            body = await store_and_render_async(request, name, entity_id,
+                                                version, data)
+            if data is None:
+                return 404, self.content_headers(body), body
+        headers.update(self.content_headers(body))
+        return 200, headers, body
+
+    def content_headers(self, body):
+        return {'Content-Type': 'text/html; charset=utf-8',
+                'Content-Length': str(len(body))}
+
+
+application = AsyncApp(app)
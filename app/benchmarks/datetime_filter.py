@@ -0,0 +1,86 @@
+"""Benchmark the `datetime` template filter on a page of 10k shows.
+
+Renders the show start times of a synthetic page with the previous
+dateutil + babel.format_datetime filter and with the memoized one, cold
+(empty caches) and warm (the page rendered before), and prints the
+per-call cost of each.
+
+    python -m app.benchmarks.datetime_filter --shows 10000
+"""
+import argparse
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+from jinja2 import Environment
+
+from app.app import format_datetime, get_datetime_pattern
+
+
+PAGE = "{% for show in shows %}{{ show.start_time|datetime('full') }}\n" \
+       "{% endfor %}"
+
+
+def dateutil_format_datetime(value, format='medium'):
+    # the filter as it was before it was memoized
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format)
+
+
+def clear_caches():
+    format_datetime.cache_clear()
+    get_datetime_pattern.cache_clear()
+
+
+def render(template, shows, repeat, before=None):
+    samples = []
+    for _ in range(repeat):
+        if before:
+            before()
+        start = time.perf_counter()
+        output = template.render(shows=shows)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    start = datetime.now()
+    shows = [{'start_time': (start + timedelta(minutes=37 * i))
+              .isoformat() + 'Z'} for i in range(args.shows)]
+
+    environments = {}
+    for name, func in (('dateutil', dateutil_format_datetime),
+                       ('memoized', format_datetime)):
+        environments[name] = Environment()
+        environments[name].filters['datetime'] = func
+    old = environments['dateutil'].from_string(PAGE)
+    new = environments['memoized'].from_string(PAGE)
+
+    baseline, expected = render(old, shows, args.repeat)
+    cold, output = render(new, shows, args.repeat, clear_caches)
+    assert output == expected, 'the memoized filter renders differently'
+    render(new, shows, 1)
+    warm, _ = render(new, shows, args.repeat)
+
+    print(f'{args.shows} shows, median of {args.repeat} renders\n')
+    print(f'{"filter":<20}{"page ms":>12}{"us per call":>14}')
+    for name, seconds in (('dateutil', baseline),
+                          ('memoized, cold', cold),
+                          ('memoized, warm', warm)):
+        print(f'{name:<20}{seconds * 1000:>12.1f}'
+              f'{seconds / args.shows * 1e6:>14.2f}')
+
+
+if __name__ == '__main__':
+    main()
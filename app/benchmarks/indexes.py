@@ -0,0 +1,154 @@
+"""Benchmark the hot show/venue lookups with and without their indexes.
+
+Seeds a synthetic catalog into an EMPTY scratch database, then prints the
+query plan and the median timing of each query before and after the
+indexes from migrations 8eefe7e22a34 and c3f8a1d6e5b9 are created.
+
+    python -m app.benchmarks.indexes postgresql://localhost/fyyur_bench
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, func, select, text
+
+from app.app import db
+from app.custom_enum import StateEnum
+from app.models import Artist, Show, Venue
+
+
+QUERIES = {
+    'artist upcoming shows': (
+        'SELECT * FROM "Show" '
+        'WHERE artist_id = :artist_id AND starttime > :now'),
+    'venue upcoming shows': (
+        'SELECT * FROM "Show" '
+        'WHERE venue_id = :venue_id AND starttime > :now'),
+    'shows listing': (
+        'SELECT * FROM "Show" ORDER BY starttime LIMIT 50'),
+    'venues by area': (
+        'SELECT * FROM "Venue" '
+        'WHERE (state, city, name, id) > (:state, :city, :name, :venue_id) '
+        'ORDER BY state, city, name, id LIMIT 20'),
+}
+
+INDEXES = list(Show.__table__.indexes) + list(Venue.__table__.indexes)
+CITIES = [f'City {i}' for i in range(200)]
+STATES = [state.value for state in StateEnum]
+
+
+def chunked(rows, size=10000):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def seed(engine, num_venues, num_artists, num_shows):
+    db.metadata.create_all(engine, tables=[Venue.__table__,
+                                           Artist.__table__,
+                                           Show.__table__])
+    with engine.begin() as conn:
+        count = select([func.count()]).select_from(Show.__table__)
+        if conn.execute(count).scalar():
+            raise SystemExit('Refusing to seed a database that has shows.')
+
+        conn.execute(Venue.__table__.insert(), [{
+            'id': i,
+            'name': f'Venue {i}',
+            'city': random.choice(CITIES),
+            'state': random.choice(STATES),
+            'address': f'{i} Main Street'
+        } for i in range(1, num_venues + 1)])
+        conn.execute(Artist.__table__.insert(), [{
+            'id': i,
+            'name': f'Artist {i}',
+            'city': random.choice(CITIES),
+            'state': random.choice(STATES)
+        } for i in range(1, num_artists + 1)])
+
+        start = datetime.now() - timedelta(days=365 * 5)
+        shows = ({
+            'venue_id': random.randint(1, num_venues),
+            'artist_id': random.randint(1, num_artists),
+            'starttime': start + timedelta(minutes=i)
+        } for i in range(num_shows))
+        for chunk in chunked(shows):
+            conn.execute(Show.__table__.insert(), chunk)
+
+
+def explain(conn, sql, params):
+    if conn.dialect.name == 'postgresql':
+        sql = 'EXPLAIN ANALYZE ' + sql
+    else:
+        sql = 'EXPLAIN QUERY PLAN ' + sql
+    rows = conn.execute(text(sql), params).fetchall()
+    return '\n'.join('    ' + ' '.join(str(c) for c in row) for row in rows)
+
+
+def timing(conn, sql, params, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(text(sql), params).fetchall()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def run(engine, params, repeat):
+    results = {}
+    with engine.connect() as conn:
+        if conn.dialect.name == 'postgresql':
+            conn.execute(text('ANALYZE'))
+        for name, sql in QUERIES.items():
+            print(f'  {name}')
+            print(explain(conn, sql, params))
+            results[name] = timing(conn, sql, params, repeat)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('database_url', help='URL of a scratch database')
+    parser.add_argument('--venues', type=int, default=5000)
+    parser.add_argument('--artists', type=int, default=20000)
+    parser.add_argument('--shows', type=int, default=500000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    seed(engine, args.venues, args.artists, args.shows)
+
+    sample = engine.execute(Venue.__table__.select().limit(1)).first()
+    params = {
+        'artist_id': args.artists // 2,
+        'venue_id': sample.id,
+        'city': sample.city,
+        'state': str(sample.state),
+        'name': sample.name,
+        'now': datetime.now() - timedelta(days=365 * 2)
+    }
+
+    for index in INDEXES:
+        index.drop(engine)
+    print('Without indexes:')
+    before = run(engine, params, args.repeat)
+
+    for index in INDEXES:
+        index.create(engine)
+    print('With indexes:')
+    after = run(engine, params, args.repeat)
+
+    print(f'\n{"query":<24}{"before ms":>12}{"after ms":>12}')
+    for name in QUERIES:
+        print(f'{name:<24}{before[name]:>12.2f}{after[name]:>12.2f}')
+
+
+if __name__ == '__main__':
+    main()
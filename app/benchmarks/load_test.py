@@ -0,0 +1,120 @@
+"""Load test a running server with many concurrent keep-alive connections.
+
+Run it once against the WSGI server and once against the ASGI one, on
+the same database and with the same number of worker processes:
+
+    WEB_CONCURRENCY=4 WEB_THREADS=8 gunicorn -c app/gunicorn.conf.py \
+        app.wsgi:application
+    uvicorn app.asgi:application --workers 4 --port 8001
+
+    python -m app.benchmarks.load_test http://localhost:8000 --ids 1-500
+    python -m app.benchmarks.load_test http://localhost:8001 --ids 1-500
+
+Requests go to random /venues/<id> and /artists/<id> pages; the page
+cache is best disabled (CACHE_TYPE = 'null') so that every request hits
+the database.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from urllib.parse import urlsplit
+
+
+async def fetch(reader, writer, host, path):
+    """Send one request; returns the status and whether to keep the
+    connection."""
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n'.encode())
+    await writer.drain()
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('closed by the server')
+    keep_alive = status_line.startswith(b'HTTP/1.1')
+    length = None
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name, value = name.lower(), value.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'connection':
+            keep_alive = value == 'keep-alive'
+    if length is None:
+        # no length: the body runs until the server closes
+        await reader.read()
+        keep_alive = False
+    else:
+        await reader.readexactly(length)
+    return int(status_line.split()[1]), keep_alive
+
+
+async def client(url, paths, deadline, latencies, errors):
+    parts = urlsplit(url)
+    connection = None
+    while time.perf_counter() < deadline:
+        if connection is None:
+            connection = await asyncio.open_connection(parts.hostname,
+                                                       parts.port or 80)
+        reader, writer = connection
+        start = time.perf_counter()
+        try:
+            status, keep_alive = await fetch(reader, writer, parts.netloc,
+                                             random.choice(paths))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            errors.append('connection')
+            keep_alive = False
+        else:
+            latencies.append(time.perf_counter() - start)
+            if status >= 500:
+                errors.append(status)
+        if not keep_alive:
+            writer.close()
+            connection = None
+    if connection is not None:
+        connection[1].close()
+
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+async def run(url, paths, concurrency, duration):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*[client(url, paths, deadline, latencies, errors)
+                           for _ in range(concurrency)])
+    return sorted(latencies), errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('url', help='e.g. http://localhost:8000')
+    parser.add_argument('--ids', default='1-100',
+                        help='range of venue and artist ids to request')
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=30)
+    args = parser.parse_args()
+
+    first, last = map(int, args.ids.split('-'))
+    paths = [f'/{kind}/{i}' for kind in ('venues', 'artists')
+             for i in range(first, last + 1)]
+    latencies, errors = asyncio.run(
+        run(args.url.rstrip('/'), paths, args.concurrency, args.duration))
+    if not latencies:
+        raise SystemExit('no request completed')
+
+    print(f'{args.url}: {args.concurrency} connections, '
+          f'{args.duration:.0f}s')
+    print(f'  requests/s   {len(latencies) / args.duration:10.1f}')
+    print(f'  mean ms      {statistics.mean(latencies) * 1000:10.1f}')
+    for fraction in (0.5, 0.95, 0.99):
+        print(f'  p{int(fraction * 100):<2} ms       '
+              f'{percentile(latencies, fraction) * 1000:10.1f}')
+    print(f'  errors       {len(errors):10d}')
+
+
+if __name__ == '__main__':
+    main()
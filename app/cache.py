@@ -0,0 +1,249 @@
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+
+#----------------------------------------------------------------------------#
+# Backends
+#----------------------------------------------------------------------------#
+
+
+class NullBackend:
+
+    def get(self, key):
+        return False, None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+
+class MemoryBackend:
+    """In-process LRU with per-entry expiry."""
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            value, expires = entry
+            if expires is not None and expires <= time.time():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, ttl=None):
+        expires = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class RedisBackend:
+    """Shared backend so that all workers see the same entries."""
+
+    def __init__(self, url, prefix='fyyur:'):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self._redis.get(self.prefix + key)
+        if value is None:
+            return False, None
+        return True, pickle.loads(value)
+
+    def set(self, key, value, ttl=None):
+        ttl = max(1, int(ttl)) if ttl is not None else None
+        self._redis.set(self.prefix + key, pickle.dumps(value), ex=ttl)
+
+    def delete(self, key):
+        self._redis.delete(self.prefix + key)
+
+
+#----------------------------------------------------------------------------#
+# Cache
+#----------------------------------------------------------------------------#
+
+
+class Cache:
+    """Namespaced cache for page data.
+
+    Each namespace ('venues', 'venue:1', ...) carries a version token that
+    is part of every key stored under it, so invalidating a namespace is
+    a single write no matter how many entries it holds.
+    """
+
+    def __init__(self, app=None):
+        self.backend = NullBackend()
+        self.default_ttl = None
+        self._stats = {'hits': 0, 'misses': 0}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CACHE_TYPE', 'memory')
+        app.config.setdefault('CACHE_DEFAULT_TTL', 300)
+        app.config.setdefault('CACHE_MAX_ENTRIES', 1000)
+        app.config.setdefault('CACHE_REDIS_URL', None)
+
+        cache_type = app.config['CACHE_TYPE']
+        self.default_ttl = app.config['CACHE_DEFAULT_TTL']
+        if cache_type == 'redis':
+            try:
+                self.backend = RedisBackend(app.config['CACHE_REDIS_URL'])
+            except ImportError:
+                # the in-process LRU stands in when redis isn't installed
+                app.logger.warning('redis is not installed, '
+                                   'falling back to the memory cache')
+                cache_type = 'memory'
+        if cache_type == 'memory':
+            self.backend = MemoryBackend(app.config['CACHE_MAX_ENTRIES'])
+        elif cache_type == 'null':
+            self.backend = NullBackend()
+
+    def _version(self, namespace):
+        found, version = self.backend.get('ns:' + namespace)
+        if not found:
+            version = uuid.uuid4().hex
+            self.backend.set('ns:' + namespace, version)
+        return version
+
+    def _key(self, namespace, key):
+        return f'{namespace}:{self._version(namespace)}:{key}'
+
+    def _count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _ttl(self, ttl):
+        if ttl is None:
+            return self.default_ttl
+        if self.default_ttl is None:
+            return ttl
+        return min(ttl, self.default_ttl)
+
+    def get(self, namespace, key, version=None):
+        """Return (found, value) for a key.
+
+        An entry stored with another `version` (see set) counts as missing.
+        """
+        found, entry = self.backend.get(self._key(namespace, key))
+        found = found and entry[0] == version
+        self._count('hits' if found else 'misses')
+        return found, entry[1] if found else None
+
+    def set(self, namespace, key, value, ttl=None, version=None):
+        """Store a value, along with the `version` of the data it came from.
+
+        `ttl` may be a callable that derives the lifetime in seconds from
+        the value (None meaning no particular expiry); either way it is
+        capped by CACHE_DEFAULT_TTL.
+        """
+        if callable(ttl):
+            ttl = ttl(value)
+        self.backend.set(self._key(namespace, key), (version, value),
+                         self._ttl(ttl))
+
+    def get_or_set(self, namespace, key, func, ttl=None, version=None):
+        """Return the cached value or compute, store and return it."""
+        found, value = self.get(namespace, key, version)
+        if not found:
+            value = func()
+            self.set(namespace, key, value, ttl, version)
+        return value
+
+    def invalidate(self, *namespaces):
+        for namespace in namespaces:
+            self.backend.delete('ns:' + namespace)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+#----------------------------------------------------------------------------#
+# Fragment cache
+#----------------------------------------------------------------------------#
+
+
+class FragmentCacheExtension(Extension):
+    """The `{% cache name, key, ... %}...{% endcache %}` tag.
+
+    The rendered body is cached under `name` and the values of the keys
+    it depends on, e.g. `venue.id, venue.updated_at`.
+    """
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [nodes.List(args)]),
+                               [], [], body).set_lineno(lineno)
+
+    def _render(self, args, caller):
+        name, *keys = args
+        return self.environment.fragment_cache.get_or_render(
+            name, keys, caller)
+
+
+class FragmentCache:
+    """In-process LRU of rendered template fragments.
+
+    Fragments are keyed on the data they show, such as the `updated_at`
+    of their venue, so a change reaches every process, whichever one
+    wrote it, and needs no invalidation.
+    """
+
+    def __init__(self, app=None):
+        self.backend = NullBackend()
+        self.ttl = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FRAGMENT_CACHE', True)
+        app.config.setdefault('FRAGMENT_CACHE_MAX_ENTRIES', 10000)
+        app.config.setdefault('FRAGMENT_CACHE_TTL', 300)
+
+        if app.config['FRAGMENT_CACHE']:
+            self.backend = MemoryBackend(
+                app.config['FRAGMENT_CACHE_MAX_ENTRIES'])
+            self.ttl = app.config['FRAGMENT_CACHE_TTL']
+        app.jinja_env.add_extension(FragmentCacheExtension)
+        app.jinja_env.fragment_cache = self
+
+    def get_or_render(self, name, keys, render):
+        key = repr((name, keys))
+        found, value = self.backend.get(key)
+        if not found:
+            value = render()
+            self.backend.set(key, value, self.ttl)
+        return value
+
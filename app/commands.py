@@ -0,0 +1,121 @@
+import click
+
+from app.app import app, cache, db
+from app.exporter import FORMATS, export
+from app.importer import import_entities, import_shows, read_records, \
+                         reset, sync_entities, sync_shows
+from app.models import refresh_all_show_stats, refresh_due_show_stats, \
+                        refresh_show_stats
+
+
+#----------------------------------------------------------------------------#
+# Import
+#----------------------------------------------------------------------------#
+
+
+@app.cli.command('import-data')
+@click.option('--venues', 'venues_path', type=click.Path(exists=True),
+              help='Venues as .json, .jsonl or .csv')
+@click.option('--artists', 'artists_path', type=click.Path(exists=True),
+              help='Artists as .json, .jsonl or .csv')
+@click.option('--shows', 'shows_path', type=click.Path(exists=True),
+              help='Shows as .json, .jsonl or .csv')
+@click.option('--chunk-size', default=5000, show_default=True,
+              help='Rows per INSERT batch and transaction')
+@click.option('--reset', 'reset_first', is_flag=True,
+              help='Delete all venues, artists and shows first')
+@click.option('--sync', is_flag=True,
+              help='Treat the files as complete feeds and only apply the '
+                   'differences to the current rows')
+def import_data(venues_path, artists_path, shows_path, chunk_size,
+                reset_first, sync):
+    """Bulk load venues, artists and shows from files."""
+    if sync:
+        return sync_data(venues_path, artists_path, shows_path, chunk_size)
+    if reset_first:
+        reset()
+
+    if venues_path:
+        import_entities('venues', read_records(venues_path), chunk_size,
+                        click.echo)
+    if artists_path:
+        import_entities('artists', read_records(artists_path), chunk_size,
+                        click.echo)
+    venue_ids, artist_ids = set(), set()
+    if shows_path:
+        _, venue_ids, artist_ids = import_shows(read_records(shows_path),
+                                                chunk_size, click.echo)
+
+    refresh_all_show_stats()
+    cache.invalidate('venues', 'artists', 'shows',
+                     *[f'venue:{venue_id}' for venue_id in venue_ids],
+                     *[f'artist:{artist_id}' for artist_id in artist_ids])
+
+
+def sync_data(venues_path, artists_path, shows_path, chunk_size):
+    venue_ids, artist_ids = set(), set()
+    if venues_path:
+        _, venues, artists = sync_entities(
+            'venues', read_records(venues_path), click.echo)
+        venue_ids |= venues
+        artist_ids |= artists
+    if artists_path:
+        _, artists, venues = sync_entities(
+            'artists', read_records(artists_path), click.echo)
+        venue_ids |= venues
+        artist_ids |= artists
+    if shows_path:
+        _, venues, artists = sync_shows(read_records(shows_path),
+                                        chunk_size, click.echo)
+        venue_ids |= venues
+        artist_ids |= artists
+
+    refresh_show_stats(venue_ids, artist_ids)
+    db.session.commit()
+    cache.invalidate('venues', 'artists', 'shows',
+                     *[f'venue:{venue_id}' for venue_id in venue_ids],
+                     *[f'artist:{artist_id}' for artist_id in artist_ids])
+
+
+#----------------------------------------------------------------------------#
+# Show stats
+#----------------------------------------------------------------------------#
+
+
+@app.cli.command('refresh-show-stats')
+@click.option('--all', 'refresh_all', is_flag=True,
+              help='Recompute every venue and artist, not just those whose '
+                   'next show has started')
+def refresh_show_stats_command(refresh_all):
+    """Update the show counts of venues and artists with past shows.
+
+    Run it periodically (e.g. every minute from cron) so that shows that
+    have started move from the upcoming to the past counts.
+    """
+    if refresh_all:
+        refresh_all_show_stats()
+        cache.invalidate('venues', 'artists')
+        click.echo('refreshed all show stats')
+    else:
+        due = refresh_due_show_stats()
+        cache.invalidate('venues', 'artists', *[
+            f'{entity_type}:{entity_id}' for entity_type, entity_id in due])
+        click.echo(f'refreshed {len(due)} show stats')
+
+
+#----------------------------------------------------------------------------#
+# Export
+#----------------------------------------------------------------------------#
+
+
+@app.cli.command('export')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.option('--format', 'format', type=click.Choice(list(FORMATS)),
+              default='jsonl', show_default=True)
+@click.option('--output', type=click.File('w'), default='-',
+              help='File to write to, stdout by default')
+def export_data(kind, format, output):
+    """Stream all venues, artists or shows to a file."""
+    _, chunks = export(kind, format)
+    for chunk in chunks:
+        output.write(chunk)
@@ -0,0 +1,59 @@
+import hashlib
+from datetime import datetime
+from functools import wraps
+
+from flask import g, make_response, request, session
+
+from app.app import app
+
+
+def make_etag(full_path, version):
+    state = (app.config['ETAG_SALT'], full_path, version)
+    return hashlib.sha1(repr(state).encode()).hexdigest()
+
+
+def last_modified(version):
+    return max([v for v in version if isinstance(v, datetime)],
+               default=None)
+
+
+def conditional(get_version):
+    """Answer If-None-Match with 304 before the view does any work.
+
+    `get_version` receives the view arguments and returns a row of values
+    (timestamps, counts) that changes whenever the page would; None skips
+    the check, e.g. for an unknown id.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            version = get_version(**kwargs)
+            if version is None:
+                return f(*args, **kwargs)
+            g.page_version = version = tuple(version)
+
+            # pending flash messages are part of the page, render them
+            if session.get('_flashes'):
+                return f(*args, **kwargs)
+
+            etag = make_etag(request.full_path, version)
+            if request.if_none_match.contains(etag):
+                response = make_response('', 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+
+            response.set_etag(etag)
+            response.last_modified = last_modified(version)
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
+
+
+def page_version():
+    """The version `conditional` computed for the current request.
+
+    Page data cached under it is only served while it is current, so a
+    body can never be older than the ETag sent with it.
+    """
+    return g.get('page_version')
@@ -0,0 +1,22 @@
+import os
+
+from app.config import *
+
+# Production profile, selected with APP_CONFIG=app.config_production (the
+# gunicorn config does so). Everything not set here comes from config.py.
+
+# never debug in production, whatever FLASK_DEBUG or FLASK_ENV say
+DEBUG = False
+TEMPLATES_AUTO_RELOAD = False
+
+# Every worker must sign sessions with the same key
+SECRET_KEY = os.environ.get('SECRET_KEY')
+if not SECRET_KEY:
+    raise RuntimeError('SECRET_KEY must be set in production')
+
+# Each thread of a worker may hold a connection, so the pool is at least
+# as large as WEB_THREADS.
+SQLALCHEMY_ENGINE_OPTIONS = dict(
+    SQLALCHEMY_ENGINE_OPTIONS,
+    pool_size=max(SQLALCHEMY_ENGINE_OPTIONS['pool_size'],
+                  int(os.environ.get('WEB_THREADS', 1))))
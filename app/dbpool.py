@@ -0,0 +1,223 @@
+import random
+import threading
+import time
+
+from flask import current_app, has_request_context, request, session
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import event, orm
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import Pool, QueuePool
+
+
+# engine options that only apply to a QueuePool
+QUEUE_POOL_OPTIONS = ['pool_size', 'max_overflow', 'pool_timeout']
+READ_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+
+
+#----------------------------------------------------------------------------#
+# Metrics
+#----------------------------------------------------------------------------#
+
+
+class PoolMetrics:
+    """Counters shared by every pool of the process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counters = {
+                'connects': 0,
+                'checkouts': 0,
+                'checkins': 0,
+                'invalidations': 0,
+                'timeouts': 0,
+                'connection_errors': 0,
+                'wait_seconds_total': 0.0,
+                'wait_seconds_max': 0.0,
+            }
+
+    def count(self, counter, amount=1):
+        with self._lock:
+            self._counters[counter] += amount
+
+    def wait(self, seconds):
+        with self._lock:
+            self._counters['wait_seconds_total'] += seconds
+            self._counters['wait_seconds_max'] = max(
+                self._counters['wait_seconds_max'], seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counters)
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait and why they fail."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except TimeoutError:
+            pool_metrics.count('timeouts')
+            raise
+        except Exception:
+            pool_metrics.count('connection_errors')
+            raise
+        finally:
+            pool_metrics.wait(time.perf_counter() - start)
+
+
+@event.listens_for(Pool, 'connect')
+def on_connect(dbapi_connection, connection_record):
+    pool_metrics.count('connects')
+
+
+@event.listens_for(Pool, 'checkout')
+def on_checkout(dbapi_connection, connection_record, connection_proxy):
+    pool_metrics.count('checkouts')
+
+
+@event.listens_for(Pool, 'checkin')
+def on_checkin(dbapi_connection, connection_record):
+    pool_metrics.count('checkins')
+
+
+@event.listens_for(Pool, 'invalidate')
+def on_invalidate(dbapi_connection, connection_record, exception):
+    pool_metrics.count('invalidations')
+
+
+def pool_status(engine):
+    """Current pool occupancy merged with the process-wide counters."""
+    status = pool_metrics.snapshot()
+    pool = engine.pool
+    status['pool'] = type(pool).__name__
+    if isinstance(pool, QueuePool):
+        status.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            # negative while the pool is still filling up to its size
+            'overflow': max(0, pool.overflow()),
+            'max_overflow': pool._max_overflow,
+        })
+    return status
+
+
+#----------------------------------------------------------------------------#
+# Replica Routing
+#----------------------------------------------------------------------------#
+
+
+def read_only(f):
+    """Mark a view that only reads although it isn't requested with GET,
+    e.g. a search form posted with POST, so that it reads from a replica
+    and doesn't pin the client to the primary."""
+    f.read_only = True
+    return f
+
+
+def is_read_request():
+    if request.method in READ_METHODS:
+        return True
+    view = current_app.view_functions.get(request.endpoint)
+    return getattr(view, 'read_only', False)
+
+
+def reads_from_replica(app):
+    """Whether the current request may read from a replica.
+
+    Only GET and HEAD requests and read_only views do, and only once the
+    client's last write is older than REPLICA_STICKY_SECONDS, so that it
+    reads its own writes.
+    """
+    if not app.config['REPLICA_BINDS'] or not has_request_context():
+        return False
+    if not is_read_request():
+        return False
+    return session.get('primary_until', 0) <= time.time()
+
+
+def stick_to_primary(response):
+    if current_app.config['REPLICA_BINDS'] and not is_read_request():
+        session['primary_until'] = \
+            time.time() + current_app.config['REPLICA_STICKY_SECONDS']
+    return response
+
+
+class RoutingSession(SignallingSession):
+    """Session that reads from a replica and writes to the primary.
+
+    One replica is picked per session, i.e. per request, so a request
+    sees a single consistent snapshot. Flushes always go to the primary.
+    """
+
+    def __init__(self, db, **options):
+        self._replica = None
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        bind_key = mapper is not None and \
+            getattr(mapper.persist_selectable, 'info', {}).get('bind_key')
+        if bind_key or self._flushing or not reads_from_replica(self.app):
+            return super().get_bind(mapper, clause)
+        if self._replica is None:
+            state = self.app.extensions['sqlalchemy']
+            self._replica = state.db.get_engine(
+                self.app, bind=random.choice(self.app.config['REPLICA_BINDS']))
+        return self._replica
+
+
+#----------------------------------------------------------------------------#
+# Engine
+#----------------------------------------------------------------------------#
+
+
+class PooledSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy whose engines are sized and instrumented from the config.
+
+    Pool sizing comes from SQLALCHEMY_ENGINE_OPTIONS; DB_STATEMENT_TIMEOUT
+    (milliseconds) is applied to every PostgreSQL connection. Sessions
+    route reads to the REPLICA_BINDS engines (see RoutingSession).
+    """
+
+    def create_engine(self, sa_url, engine_opts):
+        if sa_url.drivername.startswith('sqlite'):
+            # SQLite connections are not pooled in a queue
+            for option in QUEUE_POOL_OPTIONS:
+                engine_opts.pop(option, None)
+        else:
+            engine_opts.setdefault('poolclass', InstrumentedQueuePool)
+
+        timeout = self.statement_timeout
+        if timeout and sa_url.drivername.startswith('postgres'):
+            connect_args = engine_opts.setdefault('connect_args', {})
+            connect_args['options'] = f'-c statement_timeout={timeout}'
+        return super().create_engine(sa_url, engine_opts)
+
+    def dispose_engines(self, app):
+        """Drop the pooled connections of the primary and replica engines.
+
+        Called in each worker after a fork, so that no two processes ever
+        share a connection inherited from the parent.
+        """
+        for bind in [None] + list(app.config['SQLALCHEMY_BINDS'] or ()):
+            self.get_engine(app, bind).dispose()
+        pool_metrics.reset()
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def init_app(self, app):
+        app.config.setdefault('REPLICA_BINDS', [])
+        app.config.setdefault('REPLICA_STICKY_SECONDS', 10)
+        self.statement_timeout = app.config.get('DB_STATEMENT_TIMEOUT')
+        app.after_request(stick_to_primary)
+        super().init_app(app)
@@ -0,0 +1,133 @@
+import csv
+import io
+import json
+from itertools import groupby
+
+from app.app import db
+from app.importer import ENTITIES
+from app.models import Artist, Show, Venue
+
+
+# the row layout of Show.info
+SHOW_FIELDS = ['venue_id', 'venue_name', 'artist_id', 'artist_name',
+               'artist_image_link', 'start_time']
+
+
+def entity_fields(kind):
+    # the layout of Venue.to_dict / Artist.to_dict without the show lists,
+    # which are exported separately as shows
+    return ['id'] + ENTITIES[kind][3] + ['genres']
+
+
+#----------------------------------------------------------------------------#
+# Rows
+#----------------------------------------------------------------------------#
+
+
+def merge_genres(entities, genres):
+    """Pair entities with their genres; both streams are ordered by id."""
+    groups = groupby(genres, key=lambda row: row[0])
+    genre_id, group = next(groups, (None, None))
+    for entity in entities:
+        while genre_id is not None and genre_id < entity.id:
+            genre_id, group = next(groups, (None, None))
+        if genre_id == entity.id:
+            yield entity, [str(genre) for _, genre in group]
+        else:
+            yield entity, []
+
+
+def iter_entities(kind, chunk_size=1000):
+    """Stream venues or artists in constant memory.
+
+    Entities and genres are read through two server-side cursors ordered
+    by id and merged, instead of one genre query per entity.
+    """
+    model, genre_model, key, fields = ENTITIES[kind]
+    entities = (db.session.query(model.id, *[getattr(model, f)
+                                             for f in fields])
+                .order_by(model.id)
+                .yield_per(chunk_size))
+    genres = (db.session.query(getattr(genre_model, key), genre_model.genre)
+              .order_by(getattr(genre_model, key))
+              .yield_per(chunk_size))
+
+    for entity, entity_genres in merge_genres(entities, genres):
+        row = {field: getattr(entity, field) for field in ['id'] + fields}
+        row['state'] = str(row['state'])
+        row['genres'] = entity_genres
+        yield row
+
+
+def iter_shows(chunk_size=1000):
+    rows = (db.session.query(
+                Show.venue_id,
+                Venue.name.label('venue_name'),
+                Show.artist_id,
+                Artist.name.label('artist_name'),
+                Artist.image_link.label('artist_image_link'),
+                Show.starttime)
+            .select_from(Show)
+            .join(Venue, Venue.id == Show.venue_id)
+            .join(Artist, Artist.id == Show.artist_id)
+            .order_by(Show.starttime, Show.venue_id, Show.artist_id)
+            .yield_per(chunk_size))
+    for row in rows:
+        yield {
+            'venue_id': row.venue_id,
+            'venue_name': row.venue_name,
+            'artist_id': row.artist_id,
+            'artist_name': row.artist_name,
+            'artist_image_link': row.artist_image_link,
+            'start_time': row.starttime.isoformat() + 'Z'
+        }
+
+
+def iter_rows(kind):
+    if kind == 'shows':
+        return SHOW_FIELDS, iter_shows()
+    return entity_fields(kind), iter_entities(kind)
+
+
+#----------------------------------------------------------------------------#
+# Formats
+#----------------------------------------------------------------------------#
+
+
+def as_jsonl(fields, rows):
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+
+def as_json(fields, rows):
+    yield '['
+    for i, row in enumerate(rows):
+        yield (',\n' if i else '\n') + json.dumps(row)
+    yield '\n]\n'
+
+
+def as_csv(fields, rows):
+    # genres are joined by semicolons, as import-data expects them
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fields)
+    writer.writeheader()
+    for row in rows:
+        if 'genres' in row:
+            row['genres'] = ';'.join(row['genres'])
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+FORMATS = {
+    'json': (as_json, 'application/json'),
+    'jsonl': (as_jsonl, 'application/x-ndjson'),
+    'csv': (as_csv, 'text/csv'),
+}
+
+
+def export(kind, format):
+    """Return the mimetype and a generator of text chunks for an export."""
+    formatter, mimetype = FORMATS[format]
+    return mimetype, formatter(*iter_rows(kind))
@@ -0,0 +1,39 @@
+"""gunicorn settings, configured from the environment.
+
+    gunicorn -c app/gunicorn.conf.py app.wsgi:application
+
+Workers default to 2 * CPUs + 1 and WEB_THREADS to 1; with more threads
+gunicorn uses its threaded worker. Each worker has its own connection
+pool, so the database must accept
+WEB_CONCURRENCY * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections.
+"""
+import multiprocessing
+import os
+
+# the app is imported after this file is read, so this picks its config
+os.environ.setdefault('APP_CONFIG', 'app.config_production')
+
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', 8000)}")
+workers = int(os.environ.get('WEB_CONCURRENCY',
+                             multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('WEB_THREADS', 1))
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+keepalive = int(os.environ.get('WEB_KEEPALIVE', 5))
+
+# Restarting workers now and then bounds the growth of the per-process
+# caches; the jitter keeps them from restarting all at once.
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+# Load the app once in the master and fork the workers from it
+preload_app = True
+
+accesslog = '-'
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    from app.app import app, db
+
+    # connections opened by the master must not be shared between workers
+    db.dispose_engines(app)
@@ -0,0 +1,434 @@
+import csv
+import enum
+import io
+import json
+import time
+from datetime import datetime
+
+from sqlalchemy import and_, bindparam
+from sqlalchemy.dialects import postgresql
+
+from app.app import db, parse_datetime
+from app.custom_enum import GenreEnum
+from app.models import Artist, ArtistGenres, EntityShowStats, Show, Venue, \
+                       VenueGenres, touch_catalog
+
+
+GENRES = {genre.value for genre in GenreEnum}
+
+VENUE_FIELDS = ['name', 'city', 'state', 'address', 'phone', 'image_link',
+                'facebook_link', 'website', 'seeking_talent',
+                'seeking_description']
+ARTIST_FIELDS = ['name', 'city', 'state', 'phone', 'image_link',
+                 'facebook_link', 'website', 'seeking_venue',
+                 'seeking_description']
+
+# model, genre model, foreign key column (on genres and shows), columns
+ENTITIES = {
+    'venues': (Venue, VenueGenres, 'venue_id', VENUE_FIELDS),
+    'artists': (Artist, ArtistGenres, 'artist_id', ARTIST_FIELDS),
+}
+
+
+#----------------------------------------------------------------------------#
+# Reading
+#----------------------------------------------------------------------------#
+
+
+def read_records(path):
+    """Stream records from a .csv, .jsonl or .json (array) file.
+
+    CSV columns are named like the JSON keys; `genres` holds the genres
+    separated by semicolons.
+    """
+    if path.endswith('.csv'):
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                if 'genres' in row:
+                    row['genres'] = [g for g in row['genres'].split(';') if g]
+                yield row
+    elif path.endswith('.jsonl'):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path) as f:
+            yield from json.load(f)
+
+
+def chunked(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def parse_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'y')
+    return bool(value)
+
+
+def parse_starttime(value):
+    """A show start time as the naive local time the Show table holds.
+
+    A trailing 'Z' is dropped, as exports write the stored times that
+    way; times with another UTC offset are converted.
+    """
+    if not isinstance(value, (str, datetime)):
+        raise TypeError(f'expected a date and time, got {value!r}')
+    try:
+        starttime = parse_datetime(value)
+    except OverflowError as e:
+        raise ValueError(str(e))
+    if starttime.tzinfo is not None:
+        starttime = starttime.astimezone().replace(tzinfo=None)
+    return starttime
+
+
+def is_postgresql():
+    return db.session.get_bind().dialect.name == 'postgresql'
+
+
+def entity_row(record, fields):
+    row = {field: record.get(field) or None for field in fields}
+    for flag in ('seeking_talent', 'seeking_venue'):
+        if flag in row:
+            row[flag] = parse_bool(row[flag])
+    return row
+
+
+#----------------------------------------------------------------------------#
+# Progress
+#----------------------------------------------------------------------------#
+
+
+class Progress:
+
+    def __init__(self, table, report=print):
+        self.table = table
+        self.report = report
+        self.rows = 0
+        self.start = time.perf_counter()
+
+    @property
+    def rate(self):
+        elapsed = time.perf_counter() - self.start
+        return self.rows / elapsed if elapsed else 0.0
+
+    def add(self, rows):
+        self.rows += rows
+        self.report(f'{self.table}: {self.rows} rows '
+                    f'({self.rate:,.0f} rows/s)')
+
+    def done(self):
+        elapsed = time.perf_counter() - self.start
+        self.report(f'{self.table}: imported {self.rows} rows in '
+                    f'{elapsed:.2f}s ({self.rate:,.0f} rows/s)')
+        return self.rows
+
+
+#----------------------------------------------------------------------------#
+# Loading
+#----------------------------------------------------------------------------#
+
+
+def reset():
+    for model in (EntityShowStats, Show, ArtistGenres, VenueGenres, Artist,
+                  Venue):
+        db.session.query(model).delete()
+    touch_catalog()
+    db.session.commit()
+
+
+def import_entities(kind, records, chunk_size=5000, report=print):
+    """Bulk insert venues or artists along with their genres."""
+    model, genre_model, genre_key, fields = ENTITIES[kind]
+    progress = Progress(kind, report)
+
+    for chunk in chunked(records, chunk_size):
+        rows = [entity_row(record, fields) for record in chunk]
+        touch_catalog()
+        db.session.execute(model.__table__.insert(), rows)
+
+        names = [row['name'] for row in rows]
+        ids = dict(db.session.query(model.name, model.id)
+                   .filter(model.name.in_(names)))
+        genres = [{genre_key: ids[record['name']], 'genre': genre}
+                  for record in chunk
+                  for genre in set(record.get('genres') or ())
+                  if genre in GENRES]
+        if genres:
+            db.session.execute(genre_model.__table__.insert(), genres)
+
+        db.session.commit()
+        progress.add(len(rows))
+
+    return progress.done()
+
+
+def resolve_show(record, venue_ids, artist_ids):
+    if record.get('venue_name'):
+        venue_id = venue_ids.get(record['venue_name'])
+    else:
+        venue_id = int(record['venue_id'])
+    if record.get('artist_name'):
+        artist_id = artist_ids.get(record['artist_name'])
+    else:
+        artist_id = int(record['artist_id'])
+    return {
+        'venue_id': venue_id,
+        'artist_id': artist_id,
+        'starttime': parse_starttime(record['start_time']),
+        'updated_at': datetime.utcnow()
+    }
+
+
+def copy_shows(rows):
+    # PostgreSQL COPY is several times faster than even a batched INSERT
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row['venue_id'], row['artist_id'],
+                         row['starttime'].isoformat(),
+                         row['updated_at'].isoformat()])
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert('COPY "Show" (venue_id, artist_id, starttime, '
+                       'updated_at) FROM STDIN WITH (FORMAT csv)', buffer)
+
+
+def import_shows(records, chunk_size=5000, report=print):
+    """Bulk insert shows, resolving venue/artist names in memory.
+
+    Shows naming an unknown venue or artist are skipped. Returns the
+    number of imported shows and the ids of the venues and artists that
+    got new shows.
+    """
+    venue_ids = dict(db.session.query(Venue.name, Venue.id))
+    artist_ids = dict(db.session.query(Artist.name, Artist.id))
+    use_copy = is_postgresql()
+    touched_venues, touched_artists = set(), set()
+    progress = Progress('shows', report)
+    skipped = 0
+
+    for chunk in chunked(records, chunk_size):
+        rows = [resolve_show(record, venue_ids, artist_ids)
+                for record in chunk]
+        rows = [row for row in rows
+                if row['venue_id'] is not None
+                and row['artist_id'] is not None]
+        skipped += len(chunk) - len(rows)
+        if not rows:
+            continue
+
+        touch_catalog()
+        if use_copy:
+            copy_shows(rows)
+        else:
+            db.session.execute(Show.__table__.insert(), rows)
+        db.session.commit()
+
+        touched_venues.update(row['venue_id'] for row in rows)
+        touched_artists.update(row['artist_id'] for row in rows)
+        progress.add(len(rows))
+
+    if skipped:
+        report(f'shows: skipped {skipped} rows with an unknown '
+               f'venue or artist')
+    return progress.done(), touched_venues, touched_artists
+
+
+#----------------------------------------------------------------------------#
+# Incremental sync
+#----------------------------------------------------------------------------#
+
+
+def comparable(row, fields):
+    # stored rows go through the same normalization as incoming ones, so
+    # that '' and None, or None and False, don't count as a change
+    return entity_row({key: str(value) if isinstance(value, enum.Enum)
+                       else value for key, value in row.items()}, fields)
+
+
+def report_counts(table, counts, report):
+    report(f'{table}: {counts["inserted"]} inserted, '
+           f'{counts["updated"]} updated, {counts["deleted"]} deleted')
+
+
+def upsert_entities(model, fields, rows):
+    table = model.__table__
+    if is_postgresql():
+        stmt = postgresql.insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['name'],
+            set_={field: stmt.excluded[field]
+                  for field in fields + ['updated_at']})
+        db.session.execute(stmt, rows)
+        return
+
+    existing = {name for name, in db.session.query(model.name)
+                .filter(model.name.in_([row['name'] for row in rows]))}
+    inserts = [row for row in rows if row['name'] not in existing]
+    updates = [dict(row, b_name=row['name']) for row in rows
+               if row['name'] in existing]
+    if inserts:
+        db.session.execute(table.insert(), inserts)
+    if updates:
+        db.session.execute(
+            table.update().where(table.c.name == bindparam('b_name')),
+            updates)
+
+
+def delete_entities(model, genre_model, genre_key, ids):
+    show_key = getattr(Show, genre_key)
+    db.session.query(Show).filter(show_key.in_(ids)) \
+        .delete(synchronize_session=False)
+    db.session.query(genre_model) \
+        .filter(getattr(genre_model, genre_key).in_(ids)) \
+        .delete(synchronize_session=False)
+    db.session.query(model).filter(model.id.in_(ids)) \
+        .delete(synchronize_session=False)
+
+
+def sync_entities(kind, records, report=print):
+    """Apply a full venue or artist feed as a diff against the table.
+
+    Rows are matched by their unique name; only new, changed and missing
+    rows (and the genres of those) are written, in one transaction.
+    Returns the counts, the ids of the changed and deleted rows and the
+    ids of the venues/artists that share shows with them.
+    """
+    model, genre_model, genre_key, fields = ENTITIES[kind]
+    now = datetime.utcnow()
+
+    incoming = {}
+    for record in records:
+        row = entity_row(record, fields)
+        genres = {g for g in record.get('genres') or () if g in GENRES}
+        incoming[row['name']] = (row, genres)
+
+    current = {row.name: row for row in db.session.query(
+        model.id, *[getattr(model, f) for f in fields])}
+    current_genres = {}
+    for entity_id, genre in db.session.query(
+            getattr(genre_model, genre_key), genre_model.genre):
+        current_genres.setdefault(entity_id, set()).add(str(genre))
+
+    changed, genre_changes, inserted = [], {}, 0
+    for name, (row, genres) in incoming.items():
+        existing = current.get(name)
+        if existing is None:
+            inserted += 1
+            changed.append(dict(row, updated_at=now))
+            genre_changes[name] = genres
+            continue
+        old_genres = current_genres.get(existing.id, set())
+        old_row = comparable({f: getattr(existing, f) for f in fields},
+                             fields)
+        if old_row != comparable(row, fields) or old_genres != genres:
+            changed.append(dict(row, updated_at=now))
+        if old_genres != genres:
+            genre_changes[name] = genres
+    deleted = [row.id for name, row in current.items()
+               if name not in incoming]
+
+    # the counterparts' pages list these entities with their shows
+    touched = {current[row['name']].id for row in changed
+               if row['name'] in current} | set(deleted)
+    counterparts = set()
+    if touched:
+        counterpart = (Show.artist_id if genre_key == 'venue_id'
+                       else Show.venue_id)
+        counterparts = {counterpart_id for counterpart_id, in db.session
+                        .query(counterpart).distinct()
+                        .filter(getattr(Show, genre_key).in_(touched))}
+
+    if changed or deleted:
+        touch_catalog()
+    if changed:
+        upsert_entities(model, fields, changed)
+    if genre_changes:
+        ids = dict(db.session.query(model.name, model.id)
+                   .filter(model.name.in_(list(genre_changes))))
+        genre_fk = getattr(genre_model, genre_key)
+        db.session.query(genre_model) \
+            .filter(genre_fk.in_([ids[name] for name in genre_changes])) \
+            .delete(synchronize_session=False)
+        genre_rows = [{genre_key: ids[name], 'genre': genre}
+                      for name, genres in genre_changes.items()
+                      for genre in genres]
+        if genre_rows:
+            db.session.execute(genre_model.__table__.insert(), genre_rows)
+    if deleted:
+        delete_entities(model, genre_model, genre_key, deleted)
+    db.session.commit()
+
+    counts = {
+        'inserted': inserted,
+        'updated': len(changed) - inserted,
+        'deleted': len(deleted)
+    }
+    report_counts(kind, counts, report)
+    return counts, touched, counterparts
+
+
+def sync_shows(records, chunk_size=5000, report=print):
+    """Apply a full show feed as a diff on the (venue, artist, start) key.
+
+    Returns the counts and the ids of the venues and artists whose shows
+    changed.
+    """
+    venue_ids = dict(db.session.query(Venue.name, Venue.id))
+    artist_ids = dict(db.session.query(Artist.name, Artist.id))
+    now = datetime.utcnow()
+
+    incoming = set()
+    for record in records:
+        row = resolve_show(record, venue_ids, artist_ids)
+        if row['venue_id'] is not None and row['artist_id'] is not None:
+            incoming.add((row['venue_id'], row['artist_id'],
+                          row['starttime']))
+    current = set(db.session.query(Show.venue_id, Show.artist_id,
+                                   Show.starttime))
+    inserts = incoming - current
+    deletes = current - incoming
+
+    if inserts or deletes:
+        touch_catalog()
+    table = Show.__table__
+    if is_postgresql():
+        insert = postgresql.insert(table).on_conflict_do_nothing()
+    else:
+        insert = table.insert()
+    for chunk in chunked(sorted(inserts), chunk_size):
+        db.session.execute(insert, [{
+            'venue_id': venue_id,
+            'artist_id': artist_id,
+            'starttime': starttime,
+            'updated_at': now
+        } for venue_id, artist_id, starttime in chunk])
+    delete = table.delete().where(and_(
+        table.c.venue_id == bindparam('b_venue_id'),
+        table.c.artist_id == bindparam('b_artist_id'),
+        table.c.starttime == bindparam('b_starttime')))
+    for chunk in chunked(sorted(deletes), chunk_size):
+        db.session.execute(delete, [{
+            'b_venue_id': venue_id,
+            'b_artist_id': artist_id,
+            'b_starttime': starttime
+        } for venue_id, artist_id, starttime in chunk])
+    db.session.commit()
+
+    counts = {'inserted': len(inserts), 'updated': 0,
+              'deleted': len(deletes)}
+    report_counts('shows', counts, report)
+    changed = inserts | deletes
+    return (counts,
+            {venue_id for venue_id, _, _ in changed},
+            {artist_id for _, artist_id, _ in changed})
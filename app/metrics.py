@@ -0,0 +1,242 @@
+import itertools
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from collections import defaultdict
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.profiling import TIME_BUCKETS
+
+
+#----------------------------------------------------------------------------#
+# Per-thread counters
+#----------------------------------------------------------------------------#
+
+
+class ShardHolder:
+    # a thread's shard, held through an object that can be weakly referenced
+
+    def __init__(self):
+        self.shard = defaultdict(float)
+
+
+class ShardedCounters:
+    """Counters that every thread increments in its own shard.
+
+    Writes touch only the calling thread's dict, so they need no lock;
+    collecting sums the shards of the live threads and what the threads
+    that have exited left behind.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = {}
+        self._retired = defaultdict(float)
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        holder = getattr(self._local, 'holder', None)
+        if holder is None:
+            holder = self._local.holder = ShardHolder()
+            shard_id = next(self._ids)
+            with self._lock:
+                self._shards[shard_id] = holder.shard
+            # the thread-local holder goes away with its thread, e.g. one
+            # of the per-request threads of the development server
+            weakref.finalize(holder, self._retire, shard_id)
+        return holder.shard
+
+    def _retire(self, shard_id):
+        with self._lock:
+            for key, value in self._shards.pop(shard_id).items():
+                self._retired[key] += value
+
+    def inc(self, name, labels=(), amount=1):
+        self._shard()[name, labels] += amount
+
+    def observe(self, name, labels, value):
+        shard = self._shard()
+        bucket = bisect_left(TIME_BUCKETS, value)
+        shard[name + '_bucket', labels + (('le', bucket),)] += 1
+        shard[name + '_sum', labels] += value
+        shard[name + '_count', labels] += 1
+
+    def collect(self):
+        with self._lock:
+            shards = list(self._shards.values())
+            totals = defaultdict(float, self._retired)
+        for shard in shards:
+            while True:
+                try:
+                    items = list(shard.items())
+                    break
+                except RuntimeError:
+                    # the owning thread added a key while it was copied
+                    continue
+            for key, value in items:
+                totals[key] += value
+        return totals
+
+
+#----------------------------------------------------------------------------#
+# Exposition
+#----------------------------------------------------------------------------#
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join('{}="{}"'.format(
+        name, str(value).replace('\\', r'\\').replace('"', r'\"'))
+        for name, value in labels)
+    return '{' + pairs + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def histogram_lines(name, totals):
+    buckets = defaultdict(lambda: [0] * len(TIME_BUCKETS))
+    for (key, labels), value in totals.items():
+        if key == name + '_bucket':
+            index = dict(labels)['le']
+            labels = tuple(label for label in labels if label[0] != 'le')
+            buckets[labels][index] += value
+
+    lines = []
+    for labels in sorted(buckets):
+        cumulative = 0
+        for bound, count in zip(TIME_BUCKETS, buckets[labels]):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else str(bound)
+            lines.append(f'{name}_bucket'
+                         f'{format_labels(labels + (("le", le),))} '
+                         f'{format_value(cumulative)}')
+        for suffix in ('_sum', '_count'):
+            lines.append(f'{name}{suffix}{format_labels(labels)} '
+                         f'{format_value(totals[name + suffix, labels])}')
+    return lines
+
+
+#----------------------------------------------------------------------------#
+# Metrics
+#----------------------------------------------------------------------------#
+
+
+# name: (type, help)
+METRICS = {
+    'http_requests_total': (
+        'counter', 'Requests by endpoint, method and status.'),
+    'http_request_duration_seconds': (
+        'histogram', 'Request latency by endpoint.'),
+    'http_requests_in_flight': (
+        'gauge', 'Requests currently being handled.'),
+    'http_request_exceptions_total': (
+        'counter', 'Requests that raised an unhandled exception.'),
+    'db_statements_total': (
+        'counter', 'SQL statements executed by endpoint.'),
+    'db_statement_seconds_total': (
+        'counter', 'Time spent executing SQL statements by endpoint.'),
+}
+
+
+class Metrics:
+    """Request, database and cache metrics in the Prometheus text format."""
+
+    def __init__(self, app=None):
+        self.counters = ShardedCounters()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.before_request(self.start)
+        app.after_request(self.finish)
+        app.teardown_request(self.teardown)
+        event.listen(Engine, 'before_cursor_execute',
+                     self.before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute',
+                     self.after_cursor_execute)
+
+    def start(self):
+        g.metrics_start = time.perf_counter()
+        self.counters.inc('http_requests_in_flight')
+
+    def finish(self, response):
+        if 'metrics_start' not in g:
+            return response
+        start = g.metrics_start
+        request_line = (request.endpoint or 'unknown', request.method,
+                        response.status_code)
+        if response.is_streamed:
+            # the rows are fetched and rendered while the body is sent
+            response.call_on_close(lambda: self.record_request(
+                *request_line, time.perf_counter() - start))
+            return response
+        self.record_request(*request_line, time.perf_counter() - start)
+        return response
+
+    def record_request(self, endpoint, method, status, duration):
+        self.counters.inc('http_requests_total', (
+            ('endpoint', endpoint),
+            ('method', method),
+            ('status', status)))
+        self.counters.observe(
+            'http_request_duration_seconds', (('endpoint', endpoint),),
+            duration)
+
+    def record_statement(self, endpoint, elapsed):
+        labels = (('endpoint', endpoint),)
+        self.counters.inc('db_statements_total', labels)
+        self.counters.inc('db_statement_seconds_total', labels, elapsed)
+
+    def teardown(self, exception):
+        if g.pop('metrics_start', None) is None:
+            return
+        self.counters.inc('http_requests_in_flight', amount=-1)
+        if exception is not None:
+            self.counters.inc('http_request_exceptions_total', (
+                ('endpoint', request.endpoint or 'unknown'),))
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters,
+                              context, executemany):
+        conn.info.setdefault('metrics_start', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters,
+                             context, executemany):
+        if not conn.info.get('metrics_start'):
+            return
+        elapsed = time.perf_counter() - conn.info['metrics_start'].pop()
+        endpoint = (request.endpoint or 'unknown') \
+            if has_request_context() else 'none'
+        self.record_statement(endpoint, elapsed)
+
+    def render(self, extra=None):
+        """Render all metrics, plus `extra` as name: (type, help, value)."""
+        totals = self.counters.collect()
+        lines = []
+        for name, (kind, help) in METRICS.items():
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'histogram':
+                lines.extend(histogram_lines(name, totals))
+                continue
+            series = sorted((labels, value)
+                            for (key, labels), value in totals.items()
+                            if key == name)
+            if not series and kind == 'gauge':
+                series = [((), 0)]
+            lines.extend(f'{name}{format_labels(labels)} '
+                         f'{format_value(value)}'
+                         for labels, value in series)
+
+        for name, (kind, help, value) in (extra or {}).items():
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.append(f'{name} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
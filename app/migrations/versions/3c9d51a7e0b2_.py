@@ -0,0 +1,31 @@
+"""add trigram indexes for name search
+
+Revision ID: 3c9d51a7e0b2
+Revises: 8eefe7e22a34
+Create Date: 2026-10-17 11:40:02.553120
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9d51a7e0b2'
+down_revision = '8eefe7e22a34'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_Venue_name_trgm', 'Venue', ['name'], unique=False,
+                    postgresql_using='gin',
+                    postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_Artist_name_trgm', 'Artist', ['name'], unique=False,
+                    postgresql_using='gin',
+                    postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_Artist_name_trgm', table_name='Artist')
+    op.drop_index('ix_Venue_name_trgm', table_name='Venue')
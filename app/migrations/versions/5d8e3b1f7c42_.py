@@ -0,0 +1,53 @@
+"""add entity_show_stats
+
+Revision ID: 5d8e3b1f7c42
+Revises: a41f6c2d9b87
+Create Date: 2026-10-17 20:31:12.870514
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d8e3b1f7c42'
+down_revision = 'a41f6c2d9b87'
+branch_labels = None
+depends_on = None
+
+
+BACKFILL = """
+INSERT INTO entity_show_stats (entity_type, entity_id, upcoming_count,
+                               past_count, next_show, refreshed_at)
+SELECT '{entity_type}', e.id,
+       count(CASE WHEN s.starttime > LOCALTIMESTAMP THEN 1 END),
+       count(CASE WHEN s.starttime <= LOCALTIMESTAMP THEN 1 END),
+       min(CASE WHEN s.starttime > LOCALTIMESTAMP THEN s.starttime END),
+       now() AT TIME ZONE 'utc'
+FROM "{table}" e LEFT OUTER JOIN "Show" s ON s.{key} = e.id
+GROUP BY e.id
+"""
+
+
+def upgrade():
+    op.create_table('entity_show_stats',
+    sa.Column('entity_type', sa.String(length=10), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('upcoming_count', sa.Integer(), nullable=False),
+    sa.Column('past_count', sa.Integer(), nullable=False),
+    sa.Column('next_show', sa.DateTime(), nullable=True),
+    sa.Column('refreshed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('entity_type', 'entity_id')
+    )
+    op.create_index('ix_entity_show_stats_next_show', 'entity_show_stats',
+                    ['next_show'], unique=False)
+    op.execute(BACKFILL.format(entity_type='venue', table='Venue',
+                               key='venue_id'))
+    op.execute(BACKFILL.format(entity_type='artist', table='Artist',
+                               key='artist_id'))
+
+
+def downgrade():
+    op.drop_index('ix_entity_show_stats_next_show',
+                  table_name='entity_show_stats')
+    op.drop_table('entity_show_stats')
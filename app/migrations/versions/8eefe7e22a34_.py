@@ -0,0 +1,32 @@
+"""add indexes for show and venue lookups
+
+Revision ID: 8eefe7e22a34
+Revises: e33cbcd54f97
+Create Date: 2026-10-17 09:12:40.118392
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8eefe7e22a34'
+down_revision = 'e33cbcd54f97'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Show_venue_id_starttime', 'Show',
+                    ['venue_id', 'starttime'], unique=False)
+    op.create_index('ix_Show_artist_id_starttime', 'Show',
+                    ['artist_id', 'starttime'], unique=False)
+    op.create_index('ix_Show_starttime', 'Show', ['starttime'], unique=False)
+    op.create_index('ix_Venue_city_state', 'Venue', ['city', 'state'],
+                    unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Venue_city_state', table_name='Venue')
+    op.drop_index('ix_Show_starttime', table_name='Show')
+    op.drop_index('ix_Show_artist_id_starttime', table_name='Show')
+    op.drop_index('ix_Show_venue_id_starttime', table_name='Show')
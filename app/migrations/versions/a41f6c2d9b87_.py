@@ -0,0 +1,29 @@
+"""add updated_at to Venue, Artist and Show
+
+Revision ID: a41f6c2d9b87
+Revises: 3c9d51a7e0b2
+Create Date: 2026-10-17 14:05:51.204377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41f6c2d9b87'
+down_revision = '3c9d51a7e0b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the server default backfills existing rows
+    for table in ['Venue', 'Artist', 'Show']:
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(),
+                                       nullable=False,
+                                       server_default=sa.func.now()))
+
+
+def downgrade():
+    for table in ['Show', 'Artist', 'Venue']:
+        op.drop_column(table, 'updated_at')
@@ -0,0 +1,31 @@
+"""add catalog_version
+
+Revision ID: b7e2c94f1a06
+Revises: 5d8e3b1f7c42
+Create Date: 2026-10-17 21:02:37.418205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2c94f1a06'
+down_revision = '5d8e3b1f7c42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('catalog_version',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('changed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute("INSERT INTO catalog_version (id, version, changed_at) "
+               "VALUES (1, 0, now() AT TIME ZONE 'utc')")
+
+
+def downgrade():
+    op.drop_table('catalog_version')
@@ -0,0 +1,27 @@
+"""index the venue directory order instead of city and state
+
+Revision ID: c3f8a1d6e5b9
+Revises: b7e2c94f1a06
+Create Date: 2026-10-17 21:18:05.662940
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f8a1d6e5b9'
+down_revision = 'b7e2c94f1a06'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.drop_index('ix_Venue_city_state', table_name='Venue')
+    op.create_index('ix_Venue_state_city_name_id', 'Venue',
+                    ['state', 'city', 'name', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Venue_state_city_name_id', table_name='Venue')
+    op.create_index('ix_Venue_city_state', 'Venue', ['city', 'state'],
+                    unique=False)
@@ -1,8 +1,13 @@
 from datetime import datetime
+from itertools import groupby
+from sqlalchemy import DDL, case, event, func, literal
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.ext.associationproxy import association_proxy
+from sqlalchemy.orm import joinedload, lazyload, load_only, undefer
 
 from app.app import db
 from app.custom_enum import GenreEnum, StateEnum
+from app.pagination import paginate
 
 GenreEnum_ = db.Enum(GenreEnum, name='genres',
                      values_callable=lambda x: [str(e.value)
@@ -12,8 +17,26 @@ StateEnum_ = db.Enum(StateEnum, name='states',
                                                 for e in StateEnum])
 
 
+def split_shows(shows, now=None):
+    # partition around a single "now" so lists and counts always agree
+    now = now or datetime.now()
+    past_shows, upcoming_shows = [], []
+    for show in shows:
+        if show.starttime > now:
+            upcoming_shows.append(show)
+        else:
+            past_shows.append(show)
+    return past_shows, upcoming_shows
+
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        # the venue directory is ordered and paged on these columns
+        db.Index('ix_Venue_state_city_name_id', 'state', 'city', 'name', 'id'),
+        db.Index('ix_Venue_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False, unique=True)
@@ -26,6 +49,8 @@ class Venue(db.Model):
     website = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String())
+    updated_at = db.Column(db.DateTime, nullable=False,
+                           default=datetime.utcnow, onupdate=datetime.utcnow)
     genres = db.relationship('VenueGenres', backref='venue', lazy='dynamic',
                              cascade="all, delete-orphan")
 
@@ -35,7 +60,7 @@ class Venue(db.Model):
     @property
     def past_shows(self):
         return Show.query.filter(
-            Show.starttime < datetime.now(),
+            Show.starttime <= datetime.now(),
             Show.venue_id == self.id).all()
 
     @property
@@ -44,14 +69,6 @@ class Venue(db.Model):
             Show.starttime > datetime.now(),
             Show.venue_id == self.id).all()
 
-    @property
-    def num_upcoming_shows(self):
-        return len(self.upcoming_shows)
-
-    @property
-    def num_past_shows(self):
-        return len(self.past_shows)
-
     @property
     def summary(self):
         return {
@@ -68,17 +85,62 @@ class Venue(db.Model):
     def __repr__(self):
         return f'<Venue: {self.name}>'
 
-    def get_areas_with_venue():
-        locations = Venue.query.distinct(Venue.city, Venue.state).all()
-        return [{'city': l.city, 'state': l.state} for l in locations]
-
-    def get_venues_by_area(city, state):
-        return Venue.query.filter_by(city=city, state=state).all()
-
-    def get_venues_by_partial_name(name):
-        return Venue.query.filter(Venue.name.ilike(f'%{name}%')).all()
+    def get_areas_with_venue_summaries(after=None, before=None, limit=20,
+                                       stream=False):
+        # one query joining the precomputed show counts instead of one
+        # query per area and per venue
+        query = (db.session.query(
+                     Venue.id, Venue.name, Venue.city, Venue.state,
+                     Venue.updated_at,
+                     func.coalesce(EntityShowStats.upcoming_count, 0)
+                     .label('num_upcoming_shows'))
+                 .outerjoin(EntityShowStats, EntityShowStats.of('venue')))
+        page = paginate(query,
+                        [Venue.state, Venue.city, Venue.name, Venue.id],
+                        lambda r: (str(r.state), r.city, r.name, r.id),
+                        after, before, limit, stream)
+
+        areas = ({
+            'city': city,
+            'state': state,
+            'venues': [{
+                'id': row.id,
+                'name': row.name,
+                'num_upcoming_shows': row.num_upcoming_shows,
+                'updated_at': row.updated_at
+            } for row in venues]
+        } for (city, state), venues in groupby(page.items,
+                                               lambda r: (r.city, r.state)))
+        return page._replace(items=areas if stream else list(areas))
+
+    def get_version(venue_id):
+        # everything a venue page shows: the venue, its shows, their
+        # artists and how many of the shows are still upcoming
+        upcoming = case([(Show.starttime > datetime.now(), 1)])
+        return (db.session.query(
+                    Venue.updated_at,
+                    func.max(Show.updated_at),
+                    func.max(Artist.updated_at),
+                    func.count(Show.starttime),
+                    func.count(upcoming))
+                .outerjoin(Show, Show.venue_id == Venue.id)
+                .outerjoin(Artist, Artist.id == Show.artist_id)
+                .filter(Venue.id == venue_id)
+                .group_by(Venue.id)
+                .first())
+
+    def get_artist_ids(venue_id):
+        return [artist_id for artist_id, in db.session.query(Show.artist_id)
+                .filter(Show.venue_id == venue_id).distinct()]
+
+    def search_by_name(term, limit):
+        return search_by_name(Venue, term, limit)
 
     def to_dict(self):
+        shows = (Show.query.filter(Show.venue_id == self.id)
+                 .order_by(Show.starttime).all())
+        past_shows, upcoming_shows = split_shows(shows)
+
         return {
             'id': self.id,
             'name': self.name,
@@ -97,15 +159,15 @@ class Venue(db.Model):
                 'artist_name': show.artist.name,
                 'artist_image_link': show.artist.image_link,
                 'start_time': show.starttime.isoformat() + 'Z'
-            } for show in self.past_shows],
+            } for show in past_shows],
             "upcoming_shows": [{
                 'artist_id': show.artist.id,
                 'artist_name': show.artist.name,
                 'artist_image_link': show.artist.image_link,
                 'start_time': show.starttime.isoformat() + 'Z'
-            } for show in self.upcoming_shows],
-            "past_shows_count": self.num_past_shows,
-            "upcoming_shows_count": self.num_upcoming_shows
+            } for show in upcoming_shows],
+            "past_shows_count": len(past_shows),
+            "upcoming_shows_count": len(upcoming_shows)
         }
 
     def from_dict(self, data):
@@ -116,6 +178,8 @@ class Venue(db.Model):
         if 'genres' in data:
             self.genres = [VenueGenres(genre=GenreEnum[genre])
                            for genre in data.getlist('genres')]
+        # genre changes alone don't mark the row dirty
+        self.updated_at = datetime.utcnow()
 
 
 class VenueGenres(db.Model):
@@ -131,6 +195,10 @@ class VenueGenres(db.Model):
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_Artist_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False, unique=True)
@@ -142,6 +210,8 @@ class Artist(db.Model):
     website = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String())
+    updated_at = db.Column(db.DateTime, nullable=False,
+                           default=datetime.utcnow, onupdate=datetime.utcnow)
     genres = db.relationship('ArtistGenres', backref='artist', lazy='dynamic',
                              cascade="all, delete-orphan")
 
@@ -151,7 +221,7 @@ class Artist(db.Model):
     @property
     def past_shows(self):
         return Show.query.filter(
-            Show.starttime < datetime.now(),
+            Show.starttime <= datetime.now(),
             Show.artist_id == self.id).all()
 
     @property
@@ -160,14 +230,6 @@ class Artist(db.Model):
             Show.starttime > datetime.now(),
             Show.artist_id == self.id).all()
 
-    @property
-    def num_upcoming_shows(self):
-        return len(self.upcoming_shows)
-
-    @property
-    def num_past_shows(self):
-        return len(self.past_shows)
-
     @property
     def summary(self):
         return {
@@ -176,10 +238,46 @@ class Artist(db.Model):
             'num_upcoming_shows': self.num_upcoming_shows
         }
 
-    def get_artists_by_partial_name(name):
-        return Artist.query.filter(Artist.name.ilike(f'%{name}%')).all()
+    def get_version(artist_id):
+        # everything an artist page shows: the artist, its shows, their
+        # venues and how many of the shows are still upcoming
+        upcoming = case([(Show.starttime > datetime.now(), 1)])
+        return (db.session.query(
+                    Artist.updated_at,
+                    func.max(Show.updated_at),
+                    func.max(Venue.updated_at),
+                    func.count(Show.starttime),
+                    func.count(upcoming))
+                .outerjoin(Show, Show.artist_id == Artist.id)
+                .outerjoin(Venue, Venue.id == Show.venue_id)
+                .filter(Artist.id == artist_id)
+                .group_by(Artist.id)
+                .first())
+
+    def get_venue_ids(artist_id):
+        return [venue_id for venue_id, in db.session.query(Show.venue_id)
+                .filter(Show.artist_id == artist_id).distinct()]
+
+    def search_by_name(term, limit):
+        return search_by_name(Artist, term, limit)
+
+    def get_artist_summaries(after=None, before=None, limit=20,
+                             stream=False):
+        query = Artist.query.options(undefer('num_upcoming_shows'))
+        page = paginate(query, [Artist.name, Artist.id],
+                        lambda a: (a.name, a.id), after, before, limit,
+                        stream)
+        summaries = (dict(a.summary, updated_at=a.updated_at)
+                     for a in page.items)
+        return page._replace(items=summaries if stream else list(summaries))
 
     def to_dict(self):
+        shows = (Show.query.options(joinedload(Show.venue),
+                                    lazyload(Show.artist))
+                 .filter(Show.artist_id == self.id)
+                 .order_by(Show.starttime).all())
+        past_shows, upcoming_shows = split_shows(shows)
+
         return {
             'id': self.id,
             'name': self.name,
@@ -197,15 +295,15 @@ class Artist(db.Model):
                 'venue_name': show.venue.name,
                 'venue_image_link': show.venue.image_link,
                 'start_time': show.starttime.isoformat() + 'Z'
-            } for show in self.past_shows],
+            } for show in past_shows],
             'upcoming_shows': [{
                 'venue_id': show.venue.id,
                 'venue_name': show.venue.name,
                 'venue_image_link': show.venue.image_link,
                 'start_time': show.starttime.isoformat() + 'Z'
-            } for show in self.upcoming_shows],
-            'past_shows_count': self.num_past_shows,
-            'upcoming_shows_count': self.num_upcoming_shows
+            } for show in upcoming_shows],
+            'past_shows_count': len(past_shows),
+            'upcoming_shows_count': len(upcoming_shows)
             }
 
     def from_dict(self, data):
@@ -215,6 +313,8 @@ class Artist(db.Model):
         if 'genres' in data:
             self.genres = [ArtistGenres(genre=GenreEnum[genre])
                            for genre in data.getlist('genres')]
+        # genre changes alone don't mark the row dirty
+        self.updated_at = datetime.utcnow()
 
 
 class ArtistGenres(db.Model):
@@ -230,6 +330,11 @@ class ArtistGenres(db.Model):
 
 class Show(db.Model):
     __tablename__ = 'Show'
+    __table_args__ = (
+        db.Index('ix_Show_venue_id_starttime', 'venue_id', 'starttime'),
+        db.Index('ix_Show_artist_id_starttime', 'artist_id', 'starttime'),
+        db.Index('ix_Show_starttime', 'starttime'),
+    )
 
     venue_id = db.Column(db.Integer,
                          db.ForeignKey('Venue.id'),
@@ -238,6 +343,8 @@ class Show(db.Model):
                           db.ForeignKey('Artist.id'),
                           primary_key=True)
     starttime = db.Column(db.DateTime, primary_key=True)
+    updated_at = db.Column(db.DateTime, nullable=False,
+                           default=datetime.utcnow, onupdate=datetime.utcnow)
 
     artist = db.relationship('Artist', lazy='joined')
 
@@ -252,6 +359,46 @@ class Show(db.Model):
             'start_time': self.starttime.isoformat() + 'Z'
         }
 
+    def get_next_starttime():
+        return (db.session.query(func.min(Show.starttime))
+                .filter(Show.starttime > datetime.now()).scalar())
+
+    def get_show_infos(upcoming=False, after=None, before=None, limit=20,
+                       stream=False):
+        # plain row tuples with just the columns of Show.info; no ORM
+        # entities, no lazy venue loads
+        query = (db.session.query(
+                     Show.venue_id,
+                     Venue.name.label('venue_name'),
+                     Show.artist_id,
+                     Artist.name.label('artist_name'),
+                     Artist.image_link.label('artist_image_link'),
+                     Show.starttime,
+                     Venue.updated_at.label('venue_updated_at'),
+                     Artist.updated_at.label('artist_updated_at'))
+                 .select_from(Show)
+                 .join(Venue, Venue.id == Show.venue_id)
+                 .join(Artist, Artist.id == Show.artist_id))
+        if upcoming:
+            query = query.filter(Show.starttime > datetime.now())
+        page = paginate(query,
+                        [Show.starttime, Show.venue_id, Show.artist_id],
+                        lambda r: (r.starttime, r.venue_id, r.artist_id),
+                        after, before, limit, stream)
+
+        infos = ({
+            'venue_id': row.venue_id,
+            'venue_name': row.venue_name,
+            'artist_id': row.artist_id,
+            'artist_name': row.artist_name,
+            'artist_image_link': row.artist_image_link,
+            'start_time': row.starttime.isoformat() + 'Z',
+            # for keying the cached tiles
+            'venue_updated_at': row.venue_updated_at,
+            'artist_updated_at': row.artist_updated_at
+        } for row in page.items)
+        return page._replace(items=infos if stream else list(infos))
+
     def __init__(self, venue=None, artist=None, starttime=None):
         self.venue = venue
         self.artist = artist
@@ -259,3 +406,234 @@ class Show(db.Model):
 
     def __repr__(self):
         return f'<{self.artist.name} @ {self.venue.name}: {self.starttime}>'
+
+
+class EntityShowStats(db.Model):
+    """Show counts and next show of a venue or an artist.
+
+    Rows are recomputed when shows are written and, for entities whose
+    next show has started since, by `flask refresh-show-stats`.
+    """
+    __tablename__ = 'entity_show_stats'
+    __table_args__ = (
+        db.Index('ix_entity_show_stats_next_show', 'next_show'),
+    )
+
+    entity_type = db.Column(db.String(10), primary_key=True)
+    entity_id = db.Column(db.Integer, primary_key=True)
+    upcoming_count = db.Column(db.Integer, nullable=False, default=0)
+    past_count = db.Column(db.Integer, nullable=False, default=0)
+    next_show = db.Column(db.DateTime)
+    refreshed_at = db.Column(db.DateTime, nullable=False,
+                             default=datetime.utcnow)
+
+    def of(entity_type):
+        model = STATS_ENTITIES[entity_type][0]
+        return (EntityShowStats.entity_type == entity_type) & \
+            (EntityShowStats.entity_id == model.id)
+
+
+STATS_ENTITIES = {
+    'venue': (Venue, Show.venue_id),
+    'artist': (Artist, Show.artist_id),
+}
+
+
+#----------------------------------------------------------------------------#
+# Show counts
+#----------------------------------------------------------------------------#
+
+
+def show_count(entity_type, column):
+    # correlated primary key lookup of the precomputed count
+    return db.column_property(
+        func.coalesce(
+            db.select([column])
+            .where(EntityShowStats.of(entity_type))
+            .correlate_except(EntityShowStats)
+            .as_scalar(), 0),
+        deferred=True, group='show_counts')
+
+
+Venue.num_upcoming_shows = show_count('venue',
+                                      EntityShowStats.upcoming_count)
+Venue.num_past_shows = show_count('venue', EntityShowStats.past_count)
+Artist.num_upcoming_shows = show_count('artist',
+                                       EntityShowStats.upcoming_count)
+Artist.num_past_shows = show_count('artist', EntityShowStats.past_count)
+
+
+def refresh_entity_stats(entity_type, ids=None, now=None):
+    """Recompute the stats of some (None: all) venues or artists."""
+    model, key = STATS_ENTITIES[entity_type]
+    now = now or datetime.now()
+    table = EntityShowStats.__table__
+    columns = ['entity_type', 'entity_id', 'upcoming_count', 'past_count',
+               'next_show', 'refreshed_at']
+    select = (db.select([
+                  literal(entity_type),
+                  model.id,
+                  func.count(case([(Show.starttime > now, 1)])),
+                  func.count(case([(Show.starttime <= now, 1)])),
+                  func.min(case([(Show.starttime > now, Show.starttime)])),
+                  literal(datetime.utcnow(), db.DateTime)])
+              .select_from(model.__table__.outerjoin(
+                  Show.__table__, key == model.id))
+              .group_by(model.id))
+    delete = table.delete().where(table.c.entity_type == entity_type)
+    if ids is not None:
+        ids = list(ids)
+        if not ids:
+            return
+        select = select.where(model.id.in_(ids))
+        delete = delete.where(table.c.entity_id.in_(ids))
+
+    touch_catalog()
+    if db.engine.dialect.name != 'postgresql':
+        # SQLite runs one writing transaction at a time
+        db.session.execute(delete)
+        db.session.execute(table.insert().from_select(columns, select))
+        return
+
+    if ids is not None:
+        # a concurrent refresh counts from a snapshot without this
+        # transaction's shows; wait for it to commit, so that the upsert
+        # below counts both (locked in id order to avoid deadlocks)
+        db.session.execute(db.select([model.id]).where(model.id.in_(ids))
+                           .order_by(model.id).with_for_update(key_share=True))
+    # concurrent refreshes of the same row update it in turn instead of
+    # failing on the primary key; only deleted entities lose their row
+    db.session.execute(delete.where(
+        table.c.entity_id.notin_(db.select([model.id]))))
+    insert = postgresql.insert(table).from_select(columns, select)
+    db.session.execute(insert.on_conflict_do_update(
+        index_elements=['entity_type', 'entity_id'],
+        set_={column: insert.excluded[column] for column in columns[2:]}))
+
+
+def refresh_show_stats(venue_ids=(), artist_ids=()):
+    """Recompute the stats of the venues and artists whose shows changed.
+
+    Runs in the caller's transaction, so that the counts commit together
+    with the change.
+    """
+    db.session.flush()
+    refresh_entity_stats('venue', venue_ids)
+    refresh_entity_stats('artist', artist_ids)
+
+
+def refresh_all_show_stats():
+    for entity_type in STATS_ENTITIES:
+        refresh_entity_stats(entity_type)
+    db.session.commit()
+
+
+def refresh_due_show_stats(now=None):
+    """Recompute the stats whose next show has started.
+
+    Returns the (entity_type, entity_id) pairs that were refreshed.
+    """
+    now = now or datetime.now()
+    due = (db.session.query(EntityShowStats.entity_type,
+                            EntityShowStats.entity_id)
+           .filter(EntityShowStats.next_show <= now).all())
+    for entity_type in STATS_ENTITIES:
+        refresh_entity_stats(entity_type, [entity_id for kind, entity_id
+                                           in due if kind == entity_type],
+                             now)
+    db.session.commit()
+    return due
+
+
+#----------------------------------------------------------------------------#
+# Search
+#----------------------------------------------------------------------------#
+
+
+# the trigram indexes on Venue.name and Artist.name need pg_trgm
+event.listen(db.metadata, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+             .execute_if(dialect='postgresql'))
+
+
+def escape_like(term):
+    return (term.replace('\\', '\\\\')
+                .replace('%', '\\%')
+                .replace('_', '\\_'))
+
+
+def search_by_name(model, term, limit):
+    # on PostgreSQL the ILIKE is answered by the pg_trgm GIN index and the
+    # hits are ranked by trigram similarity; other databases rank shorter
+    # (closer) names first
+    query = (model.query
+             .options(load_only('id', 'name'),
+                      undefer('num_upcoming_shows'))
+             .add_columns(func.count().over().label('total'))
+             .filter(model.name.ilike(f'%{escape_like(term)}%',
+                                      escape='\\')))
+    if db.engine.dialect.name == 'postgresql':
+        query = query.order_by(func.similarity(model.name, term).desc())
+    else:
+        query = query.order_by(func.length(model.name))
+    rows = query.order_by(model.name).limit(limit).all()
+
+    return {
+        'count': rows[0].total if rows else 0,
+        'data': [entity.summary for entity, total in rows]
+    }
+
+
+#----------------------------------------------------------------------------#
+# Versions
+#----------------------------------------------------------------------------#
+
+
+class CatalogVersion(db.Model):
+    """A single row counting the writes to venues, artists, shows and
+    their stats, the version of every listing page."""
+    __tablename__ = 'catalog_version'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    changed_at = db.Column(db.DateTime, nullable=False,
+                           default=datetime.utcnow)
+
+
+event.listen(CatalogVersion.__table__, 'after_create',
+             DDL("INSERT INTO catalog_version (id, version, changed_at) "
+                 "VALUES (1, 0, CURRENT_TIMESTAMP)"))
+
+
+def touch_catalog(session=db.session):
+    """Bump the catalog version in the current transaction.
+
+    Readers see the new version when the transaction commits. The row
+    lock makes catalog writes take turns, so writers take it before any
+    other lock to avoid deadlocks.
+    """
+    table = CatalogVersion.__table__
+    session.execute(table.update().where(table.c.id == 1).values(
+        version=table.c.version + 1, changed_at=datetime.utcnow()))
+
+
+@event.listens_for(db.session, 'before_flush')
+def touch_catalog_on_flush(session, flush_context, instances):
+    # every model flushed through the ORM is part of the catalog; core
+    # writes call touch_catalog() themselves
+    touch_catalog(session)
+
+
+def get_catalog_version():
+    # a primary key lookup and an index seek, whatever the catalog size
+    next_show = (db.session.query(func.min(Show.starttime))
+                 .filter(Show.starttime > datetime.now()).as_scalar())
+    row = (db.session.query(CatalogVersion.version,
+                            CatalogVersion.changed_at, next_show)
+           .filter(CatalogVersion.id == 1).first())
+    if row is None:
+        return None
+    version, changed_at, next_show = row
+    # upcoming shows drop off the listings when they start; as text, the
+    # start time isn't taken for a modification time
+    return version, changed_at, next_show and next_show.isoformat()
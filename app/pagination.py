@@ -0,0 +1,149 @@
+import base64
+import json
+from collections import namedtuple
+from datetime import datetime
+
+from flask import abort, request, url_for
+from sqlalchemy import tuple_
+
+from app.app import app, db
+
+
+Page = namedtuple('Page', ['items', 'next_cursor', 'prev_cursor'])
+
+
+#----------------------------------------------------------------------------#
+# Cursors
+#----------------------------------------------------------------------------#
+
+
+def encode_cursor(values):
+    values = [v.isoformat() if isinstance(v, datetime) else v
+              for v in values]
+    data = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(data)
+        assert isinstance(values, list) and len(values) == len(columns)
+        return [datetime.fromisoformat(v)
+                if isinstance(c.type, db.DateTime) else v
+                for c, v in zip(columns, values)]
+    except (ValueError, TypeError, AssertionError):
+        abort(400)
+
+
+#----------------------------------------------------------------------------#
+# Keyset pagination
+#----------------------------------------------------------------------------#
+
+
+def get_page_args():
+    limit = request.args.get('limit', app.config['PAGE_SIZE'], type=int)
+    return {
+        'after': request.args.get('after'),
+        'before': request.args.get('before'),
+        'limit': max(1, min(limit, app.config['MAX_PAGE_SIZE']))
+    }
+
+
+def get_flag_arg(name):
+    # `type=bool` would treat ?upcoming=0 and ?upcoming=false as true
+    return request.args.get(name, '').lower() in ('1', 'true', 'yes')
+
+
+class StreamedPage:
+    """A forward page whose rows are fetched while they are iterated.
+
+    The cursors are only known once `items` has been consumed, which is
+    the case when a template renders its pager after the listing.
+    """
+
+    def __init__(self, query, key, after, limit, chunk_size=100):
+        self.key = key
+        self.after = after
+        self.limit = limit
+        self._first = self._last = None
+        self._has_more = False
+        self.items = self._iter_rows(query.limit(limit + 1)
+                                     .yield_per(chunk_size))
+
+    def _iter_rows(self, rows):
+        # the one extra row is drained rather than broken off, so that
+        # the cursor is closed
+        for i, row in enumerate(rows):
+            if i == self.limit:
+                self._has_more = True
+                continue
+            if i == 0:
+                self._first = row
+            self._last = row
+            yield row
+
+    def _replace(self, items):
+        self.items = items
+        return self
+
+    @property
+    def next_cursor(self):
+        if self._has_more:
+            return encode_cursor(self.key(self._last))
+        return None
+
+    @property
+    def prev_cursor(self):
+        if self.after and self._first is not None:
+            return encode_cursor(self.key(self._first))
+        return None
+
+
+def paginate(query, columns, key, after=None, before=None, limit=20,
+             stream=False):
+    """Seek through `query` ordered by the unique tuple `columns`.
+
+    `key` maps a result row to its values for `columns`, which become the
+    cursors of the returned page. With `stream`, forward pages come back
+    as a StreamedPage; backward pages are reversed, so they never stream.
+    """
+    if stream and not before:
+        if after:
+            values = decode_cursor(after, columns)
+            query = query.filter(tuple_(*columns) > tuple_(*values))
+        return StreamedPage(query.order_by(*columns), key, after, limit)
+
+    if before:
+        values = decode_cursor(before, columns)
+        query = (query.filter(tuple_(*columns) < tuple_(*values))
+                 .order_by(*[c.desc() for c in columns]))
+    else:
+        if after:
+            values = decode_cursor(after, columns)
+            query = query.filter(tuple_(*columns) > tuple_(*values))
+        query = query.order_by(*columns)
+
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if before:
+        rows.reverse()
+
+    if not rows:
+        return Page(rows, None, None)
+    has_next = has_more if not before else True
+    has_prev = has_more if before else bool(after)
+    return Page(
+        rows,
+        encode_cursor(key(rows[-1])) if has_next else None,
+        encode_cursor(key(rows[0])) if has_prev else None)
+
+
+@app.template_global()
+def url_for_page(**cursor):
+    args = request.args.to_dict()
+    args.pop('after', None)
+    args.pop('before', None)
+    args.update(cursor)
+    return url_for(request.endpoint, **request.view_args, **args)
@@ -0,0 +1,247 @@
+import heapq
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, has_request_context, request
+from jinja2 import Template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# upper bounds of the histogram buckets, the last one catching the rest
+TIME_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+                float('inf')]
+COUNT_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, float('inf')]
+
+
+#----------------------------------------------------------------------------#
+# Histograms
+#----------------------------------------------------------------------------#
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += 1
+        self.sum += value
+
+    def to_dict(self):
+        return {
+            'count': self.total,
+            'sum': self.sum,
+            'mean': self.sum / self.total if self.total else 0,
+            # (upper bound, count) pairs in order, like Prometheus' `le`
+            'buckets': [['+Inf' if bound == float('inf') else bound, count]
+                        for bound, count in zip(self.buckets, self.counts)]
+        }
+
+
+class EndpointStats:
+
+    def __init__(self):
+        self.duration = Histogram(TIME_BUCKETS)
+        self.db_time = Histogram(TIME_BUCKETS)
+        self.template_time = Histogram(TIME_BUCKETS)
+        self.statements = Histogram(COUNT_BUCKETS)
+
+    def to_dict(self):
+        return {
+            'duration': self.duration.to_dict(),
+            'db_time': self.db_time.to_dict(),
+            'template_time': self.template_time.to_dict(),
+            'statements': self.statements.to_dict()
+        }
+
+
+#----------------------------------------------------------------------------#
+# Hooks
+#----------------------------------------------------------------------------#
+
+
+def current_profile():
+    if has_request_context():
+        return g.get('profile')
+    return None
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    if current_profile() is not None:
+        conn.info.setdefault('profile_start', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context,
+                         executemany):
+    profile = current_profile()
+    if profile is None or not conn.info.get('profile_start'):
+        return
+    add_statement(profile, statement,
+                  time.perf_counter() - conn.info['profile_start'].pop())
+
+
+def add_statement(profile, statement, elapsed):
+    profile['statements'] += 1
+    profile['db_time'] += elapsed
+    slowest = profile['slowest']
+    entry = (elapsed, profile['statements'], statement)
+    if len(slowest) < profile['top']:
+        heapq.heappush(slowest, entry)
+    else:
+        heapq.heappushpop(slowest, entry)
+
+
+class ProfiledTemplate(Template):
+    """Adds the time spent rendering to the current request's profile.
+
+    Only top-level renders are timed; included and extended templates
+    are part of their parent's render. Queries run from the template
+    count towards both the template and the database time.
+    """
+
+    def render(self, *args, **kwargs):
+        profile = current_profile()
+        if profile is None:
+            return super().render(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            profile['template_time'] += time.perf_counter() - start
+
+    def generate(self, *args, **kwargs):
+        # streamed templates: time each chunk, not the wait for the client
+        chunks = super().generate(*args, **kwargs)
+        profile = current_profile()
+        if profile is None:
+            yield from chunks
+            return
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                return
+            finally:
+                profile['template_time'] += time.perf_counter() - start
+            yield chunk
+
+
+#----------------------------------------------------------------------------#
+# Profiler
+#----------------------------------------------------------------------------#
+
+
+class Profiler:
+    """Opt-in per-request profiling of SQL statements and templates.
+
+    While PROFILING is enabled every request records its statement count,
+    database time, template time and slowest statements, which are
+    aggregated into histograms per endpoint. Requests over
+    PROFILING_SLOW_REQUEST seconds or PROFILING_MAX_STATEMENTS statements
+    are logged with their slowest statements.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self._endpoints = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PROFILING', False)
+        app.config.setdefault('PROFILING_SLOW_REQUEST', 0.5)
+        app.config.setdefault('PROFILING_MAX_STATEMENTS', 20)
+        app.config.setdefault('PROFILING_TOP_STATEMENTS', 5)
+
+        self.enabled = app.config['PROFILING']
+        if not self.enabled:
+            return
+        self.app = app
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+        app.jinja_env.template_class = ProfiledTemplate
+        app.before_request(self.start)
+        app.after_request(self.finish)
+
+    def start(self):
+        g.profile = self.new_profile()
+
+    def new_profile(self):
+        return {
+            'start': time.perf_counter(),
+            'statements': 0,
+            'db_time': 0.0,
+            'template_time': 0.0,
+            'slowest': [],
+            'top': self.app.config['PROFILING_TOP_STATEMENTS']
+        }
+
+    def finish(self, response):
+        profile = g.get('profile')
+        if profile is None:
+            return response
+        request_line = (request.endpoint or 'unknown', request.method,
+                        request.full_path)
+        if response.is_streamed:
+            # the body, and the queries and template time behind it, is
+            # produced after this hook: record the profile once it is
+            # sent; its figures can't go in the headers
+            response.call_on_close(lambda: self.record(profile,
+                                                       *request_line))
+            return response
+
+        del g.profile
+        duration = self.record(profile, *request_line)
+        response.headers.extend(self.headers(profile, duration))
+        return response
+
+    def headers(self, profile, duration):
+        return {
+            'Server-Timing': ', '.join([
+                f'db;dur={profile["db_time"] * 1000:.1f}',
+                f'tpl;dur={profile["template_time"] * 1000:.1f}',
+                f'total;dur={duration * 1000:.1f}'
+            ]),
+            'X-Statement-Count': str(profile['statements'])
+        }
+
+    def record(self, profile, endpoint, method, full_path):
+        """Add a finished request to its endpoint's stats, log it if it
+        was slow and return its duration."""
+        duration = time.perf_counter() - profile['start']
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = EndpointStats()
+            stats.duration.observe(duration)
+            stats.db_time.observe(profile['db_time'])
+            stats.template_time.observe(profile['template_time'])
+            stats.statements.observe(profile['statements'])
+
+        config = self.app.config
+        if duration > config['PROFILING_SLOW_REQUEST'] or \
+                profile['statements'] > config['PROFILING_MAX_STATEMENTS']:
+            slowest = sorted(profile['slowest'], reverse=True)
+            self.app.logger.warning(
+                'slow request %s %s: %.3fs, %d statements in %.3fs, '
+                'templates %.3fs\n%s',
+                method, full_path, duration,
+                profile['statements'], profile['db_time'],
+                profile['template_time'],
+                '\n'.join(f'  {elapsed:.3f}s {statement}'
+                          for elapsed, _, statement in slowest))
+        return duration
+
+    def stats(self):
+        with self._lock:
+            return {endpoint: stats.to_dict()
+                    for endpoint, stats in sorted(self._endpoints.items())}
@@ -1,9 +1,69 @@
+import time
+from datetime import datetime
 from flask import abort, render_template, request, Response, flash, \
-                  redirect, url_for
+                  redirect, stream_with_context, url_for, jsonify
 from app.forms import ArtistForm, VenueForm, ShowForm
-from app.models import Artist, Venue, Show, ArtistGenres, VenueGenres
-from app.app import app, db
+from app.models import Artist, Venue, Show, ArtistGenres, VenueGenres, \
+                       get_catalog_version, refresh_show_stats
+from app.app import app, cache, db, metrics, profiler
 from app.custom_enum import GenreEnum, StateEnum
+from app.conditional import conditional, page_version
+from app.dbpool import pool_status, read_only
+from app.exporter import export
+from app.pagination import get_flag_arg, get_page_args
+from app.streaming import stream_template, streams
+
+
+#----------------------------------------------------------------------------#
+# Cache Invalidation
+#----------------------------------------------------------------------------#
+
+
+def venue_namespaces(venue_id, artist_ids=None):
+    # artist pages list the venue's name and image with each show
+    if artist_ids is None:
+        artist_ids = Venue.get_artist_ids(venue_id)
+    return ['venues', 'shows', f'venue:{venue_id}',
+            *[f'artist:{artist_id}' for artist_id in artist_ids]]
+
+
+def artist_namespaces(artist_id, venue_ids=None):
+    # venue pages list the artist's name and image with each show
+    if venue_ids is None:
+        venue_ids = Artist.get_venue_ids(artist_id)
+    return ['artists', 'shows', f'artist:{artist_id}',
+            *[f'venue:{venue_id}' for venue_id in venue_ids]]
+
+
+def show_namespaces(venue_id, artist_id):
+    return ['venues', 'artists', 'shows',
+            f'venue:{venue_id}', f'artist:{artist_id}']
+
+
+#----------------------------------------------------------------------------#
+# Cache Expiry
+#----------------------------------------------------------------------------#
+
+
+# Upcoming counts and lists change when a show starts, without any write,
+# so those entries expire exactly when the next upcoming show starts.
+
+
+def seconds_until(starttime):
+    if starttime is None:
+        return None
+    return max(0, (starttime - datetime.now()).total_seconds())
+
+
+def until_next_show(data):
+    return seconds_until(Show.get_next_starttime())
+
+
+def until_next_upcoming_show(data):
+    if not data['upcoming_shows']:
+        return None
+    start_time = data['upcoming_shows'][0]['start_time']
+    return seconds_until(datetime.fromisoformat(start_time.rstrip('Z')))
 
 
 #----------------------------------------------------------------------------#
@@ -22,31 +82,40 @@ def index():
 
 
 @app.route('/venues')
+@conditional(get_catalog_version)
 def venues():
-    data = Venue.get_areas_with_venue()
-    for d in data:
-        venues = Venue.get_venues_by_area(d['city'], d['state'])
-        d['venues'] = [venue.summary for venue in venues]
+    args = get_page_args()
+    if streams(args):
+        page = Venue.get_areas_with_venue_summaries(stream=True, **args)
+        return stream_template('pages/venues.html', areas=page.items,
+                               page=page)
+
+    page = cache.get_or_set(
+        'venues', repr(sorted(args.items())),
+        lambda: Venue.get_areas_with_venue_summaries(**args),
+        ttl=until_next_show, version=page_version())
 
-    return render_template('pages/venues.html', areas=data)
+    return render_template('pages/venues.html', areas=page.items, page=page)
 
 
 @app.route('/venues/search', methods=['POST'])
+@read_only
 def search_venues():
     search_term = request.form.get('search_term', '')
-    venues = Venue.get_venues_by_partial_name(search_term)
-    response = {
-        'count': len(venues),
-        'data': [venue.summary for venue in venues]
-    }
+    response = Venue.search_by_name(search_term,
+                                    app.config['SEARCH_RESULTS_LIMIT'])
 
     return render_template('pages/search_venues.html', results=response,
                            search_term=search_term)
 
 
 @app.route('/venues/<int:venue_id>')
+@conditional(Venue.get_version)
 def show_venue(venue_id):
-    data = Venue.query.filter(Venue.id == venue_id).first().to_dict()
+    data = cache.get_or_set(
+        f'venue:{venue_id}', 'detail',
+        lambda: Venue.query.get_or_404(venue_id).to_dict(),
+        ttl=until_next_upcoming_show, version=page_version())
 
     return render_template('pages/show_venue.html', venue=data)
 
@@ -78,6 +147,7 @@ def create_venue_submission():
                         for genre in data.getlist('genres')]
         db.session.add(venue)
         db.session.commit()
+        cache.invalidate('venues')
     except:
         error = True
         db.session.rollback()
@@ -118,6 +188,7 @@ def edit_venue_submission(venue_id):
     try:
         venue.from_dict(data)
         db.session.commit()
+        cache.invalidate(*venue_namespaces(venue_id))
         flash('Update successful!', 'alert-success')
     except:
         error = True
@@ -139,12 +210,18 @@ def delete_venue(venue_id):
     error = False
     try:
         venue = Venue.query.filter_by(id=venue_id).first()
+        artist_ids = Venue.get_artist_ids(venue.id)
+        namespaces = venue_namespaces(venue.id, artist_ids)
+        # make sure the upcoming count isn't stale before relying on it
+        refresh_show_stats(venue_ids=[venue.id])
         # delete associated shows if no upcoming show is scheduled
         if venue.num_upcoming_shows == 0:
             db.session.query(Show).filter_by(venue_id=venue_id).delete()
         # this will fail if there are upcoming shows associated with the Venue
         db.session.delete(venue)
+        refresh_show_stats(venue_ids=[venue.id], artist_ids=artist_ids)
         db.session.commit()
+        cache.invalidate(*namespaces)
     except:
         error = True
         db.session.rollback()
@@ -171,28 +248,40 @@ def delete_venue(venue_id):
 
 
 @app.route('/artists')
+@conditional(get_catalog_version)
 def artists():
-    artists = Artist.query.all()
-    data = [artist.summary for artist in artists]
+    args = get_page_args()
+    if streams(args):
+        page = Artist.get_artist_summaries(stream=True, **args)
+        return stream_template('pages/artists.html', artists=page.items,
+                               page=page)
+
+    page = cache.get_or_set(
+        'artists', repr(sorted(args.items())),
+        lambda: Artist.get_artist_summaries(**args),
+        ttl=until_next_show, version=page_version())
 
-    return render_template('pages/artists.html', artists=data)
+    return render_template('pages/artists.html', artists=page.items,
+                           page=page)
 
 
 @app.route('/artists/search', methods=['POST'])
+@read_only
 def search_artists():
     search_term = request.form.get('search_term', '')
-    artists = Artist.get_artists_by_partial_name(search_term)
-    response = {
-        "count": len(artists),
-        "data": [artist.summary for artist in artists]
-    }
+    response = Artist.search_by_name(search_term,
+                                     app.config['SEARCH_RESULTS_LIMIT'])
     return render_template('pages/search_artists.html', results=response,
                            search_term=search_term)
 
 
 @app.route('/artists/<int:artist_id>')
+@conditional(Artist.get_version)
 def show_artist(artist_id):
-    data = Artist.query.filter(Artist.id == artist_id).first().to_dict()
+    data = cache.get_or_set(
+        f'artist:{artist_id}', 'detail',
+        lambda: Artist.query.get_or_404(artist_id).to_dict(),
+        ttl=until_next_upcoming_show, version=page_version())
 
     return render_template('pages/show_artist.html', artist=data)
 
@@ -223,6 +312,7 @@ def create_artist_submission():
                          for genre in data.getlist('genres')]
         db.session.add(artist)
         db.session.commit()
+        cache.invalidate('artists')
     except:
         error = True
         db.session.rollback()
@@ -261,6 +351,7 @@ def edit_artist_submission(artist_id):
     try:
         artist.from_dict(data)
         db.session.commit()
+        cache.invalidate(*artist_namespaces(artist_id))
         flash('Update successful!', 'alert-success')
     except:
         error = True
@@ -281,12 +372,18 @@ def delete_artist(artist_id):
     error = False
     try:
         artist = Artist.query.filter_by(id=artist_id).first()
+        venue_ids = Artist.get_venue_ids(artist.id)
+        namespaces = artist_namespaces(artist.id, venue_ids)
+        # make sure the upcoming count isn't stale before relying on it
+        refresh_show_stats(artist_ids=[artist.id])
         # delete all associated shows if no upcoming show is scheduled
         if artist.num_upcoming_shows == 0:
             db.session.query(Show).filter_by(artist_id=artist_id).delete()
         # this will fail if there are still shows associated with the Artist
         db.session.delete(artist)
+        refresh_show_stats(venue_ids=venue_ids, artist_ids=[artist.id])
         db.session.commit()
+        cache.invalidate(*namespaces)
     except:
         error = True
         db.session.rollback()
@@ -313,9 +410,22 @@ def delete_artist(artist_id):
 
 
 @app.route('/shows')
+@conditional(get_catalog_version)
 def shows():
-    data = [show.info for show in Show.query.all()]
-    return render_template('pages/shows.html', shows=data)
+    upcoming = get_flag_arg('upcoming')
+    args = get_page_args()
+    if streams(args):
+        page = Show.get_show_infos(upcoming=upcoming, stream=True, **args)
+        return stream_template('pages/shows.html', shows=page.items,
+                               page=page, upcoming=upcoming)
+
+    page = cache.get_or_set(
+        'shows', repr((upcoming, sorted(args.items()))),
+        lambda: Show.get_show_infos(upcoming=upcoming, **args),
+        ttl=until_next_show if upcoming else None,
+        version=page_version())
+    return render_template('pages/shows.html', shows=page.items, page=page,
+                           upcoming=upcoming)
 
 
 @app.route('/shows/create')
@@ -351,7 +461,9 @@ def create_show_submission():
         show = Show(venue=venue, artist=artist, starttime=str(starttime))
         print(show)
         db.session.add(show)
+        refresh_show_stats(venue_ids=[venue.id], artist_ids=[artist.id])
         db.session.commit()
+        cache.invalidate(*show_namespaces(venue.id, artist.id))
     except:
         error = True
         flash('Something went wrong. Maybe an invalid start time?', 'alert-danger')
@@ -364,16 +476,111 @@ def create_show_submission():
     return render_template('pages/home.html')
 
 
+#----------------------------------------------------------------------------#
+# Export
+#----------------------------------------------------------------------------#
+
+
+@app.route('/export/<any(venues, artists, shows):kind>'
+           '.<any(json, jsonl, csv):format>')
+def export_data(kind, format):
+    mimetype, chunks = export(kind, format)
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = \
+        f'attachment; filename={kind}.{format}'
+    return response
+
+
+#----------------------------------------------------------------------------#
+# Health
+#----------------------------------------------------------------------------#
+
+
+@app.route('/health/db')
+def db_health():
+    start = time.perf_counter()
+    try:
+        # the primary, whose pool is the one reported below
+        with db.engine.connect() as connection:
+            connection.execute('SELECT 1')
+        healthy = True
+    except Exception:
+        app.logger.exception('database health check failed')
+        healthy = False
+
+    return jsonify({
+        'healthy': healthy,
+        'latency_seconds': time.perf_counter() - start,
+        'pool': pool_status(db.engine)
+    }), 200 if healthy else 503
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    cache_stats = cache.stats()
+    pool = pool_status(db.engine)
+    extra = {
+        'cache_hits_total': (
+            'counter', 'Page cache hits.', cache_stats['hits']),
+        'cache_misses_total': (
+            'counter', 'Page cache misses.', cache_stats['misses']),
+        'cache_hit_ratio': (
+            'gauge', 'Page cache hits per lookup.', cache_stats['hit_ratio']),
+        'db_pool_checkouts_total': (
+            'counter', 'Connections checked out of the pool.',
+            pool['checkouts']),
+        'db_pool_wait_seconds_total': (
+            'counter', 'Time spent waiting for a pooled connection.',
+            pool['wait_seconds_total']),
+        'db_pool_timeouts_total': (
+            'counter', 'Checkouts that timed out on an exhausted pool.',
+            pool['timeouts']),
+        'db_pool_connection_errors_total': (
+            'counter', 'Failures to open a database connection.',
+            pool['connection_errors']),
+    }
+    for key in ('size', 'checked_out', 'overflow'):
+        if key in pool:
+            extra[f'db_pool_{key}'] = (
+                'gauge', f'Pool {key.replace("_", " ")} connections.',
+                pool[key])
+    return Response(metrics.render(extra),
+                    mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/debug/profile')
+def profile_stats():
+    if not profiler.enabled:
+        abort(404)
+    return jsonify(profiler.stats())
+
+
 #----------------------------------------------------------------------------#
 # Error Handlers
 #----------------------------------------------------------------------------#
 
 
+def api_error(error):
+    return jsonify({'error': error.description}), error.code
+
+
+@app.errorhandler(400)
+@app.errorhandler(409)
+def client_error(error):
+    if request.path.startswith('/api/'):
+        return api_error(error)
+    return error
+
+
 @app.errorhandler(404)
 def not_found_error(error):
+    if request.path.startswith('/api/'):
+        return api_error(error)
     return render_template('errors/404.html'), 404
 
 
 @app.errorhandler(500)
 def server_error(error):
+    if request.path.startswith('/api/'):
+        return jsonify({'error': 'Internal Server Error'}), 500
     return render_template('errors/500.html'), 500
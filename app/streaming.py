@@ -0,0 +1,26 @@
+from flask import Response, stream_with_context
+
+from app.app import app
+
+
+def streams(page_args):
+    """Whether a listing with these page arguments is streamed.
+
+    Only forward pages stream, see `paginate`.
+    """
+    return app.config['STREAM_TEMPLATES'] and not page_args['before']
+
+
+def stream_template(template_name, **context):
+    """Like render_template, but send the page as it is being rendered.
+
+    The layout up to the listing goes out before the listing's rows are
+    fetched; generators in `context` are consumed while rendering, still
+    within the request context.
+    """
+    app.update_template_context(context)
+    template = app.jinja_env.get_or_select_template(template_name)
+    stream = template.stream(context)
+    stream.enable_buffering(app.config['STREAM_BUFFER_SIZE'])
+    return Response(stream_with_context(stream), mimetype='text/html')
+
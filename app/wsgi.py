@@ -0,0 +1,30 @@
+"""WSGI entry point for pre-fork servers.
+
+    gunicorn -c app/gunicorn.conf.py app.wsgi:application
+
+With `preload_app` the master imports this module once: the views,
+compiled templates and locale data it loads are then shared by the
+forked workers through copy-on-write memory.
+"""
+from babel.dates import LC_TIME
+
+from app.app import DATETIME_FORMATS, db, get_datetime_pattern
+
+
+def prepare_app():
+    """Warm up the module-level app for forking: register its views,
+    compile its templates and load the locale data, then drop any database
+    connection. Returns the app."""
+    from app import app
+
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        app.jinja_env.get_template(name)
+    # loads the locale data used by the datetime filter
+    for format in DATETIME_FORMATS:
+        get_datetime_pattern(format, LC_TIME)
+    # whatever connected while importing must not be inherited
+    db.dispose_engines(app)
+    return app
+
+
+application = prepare_app()
@@ -0,0 +1,45 @@
+import os
+import tempfile
+
+import pytest
+
+# the app reads its database from the environment when it is imported
+DATABASE = os.path.join(tempfile.mkdtemp(), 'fyyur.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DATABASE}'
+os.environ['PROFILING'] = '1'
+
+from app import app as flask_app  # noqa: E402
+from app.app import cache, db  # noqa: E402
+from app.cache import NullBackend  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+
+@pytest.fixture
+def app(monkeypatch):
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    # every request should reach the database
+    monkeypatch.setattr(cache, 'backend', NullBackend())
+    with flask_app.app_context():
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def statements(app):
+    """SQL statements run while the test's requests are handled."""
+    executed = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    engine = db.get_engine(app)
+    event.listen(engine, 'before_cursor_execute', count)
+    yield executed
+    event.remove(engine, 'before_cursor_execute', count)
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.app import db
+from app.models import Artist, Show, Venue
+
+
+@pytest.fixture
+def ids(app):
+    venue = Venue(name='Venue', city='San Francisco', state='CA',
+                  address='1 Main St')
+    artist = Artist(name='Artist', city='San Francisco', state='CA')
+    db.session.add_all([venue, artist])
+    db.session.commit()
+    return {'venue_id': venue.id, 'artist_id': artist.id}
+
+
+@pytest.mark.parametrize('start_time', [123, None, ['2030-01-01'], 'soon'])
+def test_batch_rejects_invalid_start_times(client, ids, start_time):
+    response = client.post('/api/v1/shows/batch',
+                           json=[dict(ids, start_time=start_time)])
+    assert response.status_code == 400
+    assert response.json['errors'][0]['index'] == 0
+    assert Show.query.count() == 0
+
+
+def test_batch_converts_start_times_with_an_offset(client, ids):
+    start = datetime(2030, 1, 1, 20, 0, tzinfo=timezone(timedelta(hours=2)))
+    response = client.post('/api/v1/shows/batch',
+                           json=[dict(ids, start_time=start.isoformat())])
+    assert response.status_code == 201
+    stored = Show.query.one().starttime
+    assert stored == start.astimezone().replace(tzinfo=None)
+
+
+@pytest.mark.parametrize('venue_id', [True, 1.7, '1.7', ' 1', None])
+def test_batch_rejects_ids_that_are_not_integers(client, ids, venue_id):
+    response = client.post('/api/v1/shows/batch', json=[
+        dict(ids, start_time='2030-01-01T20:00:00'),
+        dict(ids, venue_id=venue_id, start_time='2030-01-02T20:00:00')])
+    assert response.status_code == 400
+    assert response.json['errors'] == [{
+        'index': 1, 'error': 'venue_id and artist_id must be integers'}]
+    assert Show.query.count() == 0
+
+
+def test_batch_accepts_ids_as_digit_strings(client, ids):
+    response = client.post('/api/v1/shows/batch', json=[{
+        'venue_id': str(ids['venue_id']),
+        'artist_id': str(ids['artist_id']),
+        'start_time': '2030-01-01T20:00:00'}])
+    assert response.status_code == 201
+    assert Show.query.count() == 1
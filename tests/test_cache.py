@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.app import cache, db
+from app.cache import MemoryBackend
+from app.models import Artist, Show, Venue, refresh_all_show_stats
+
+
+@pytest.fixture
+def show(app, monkeypatch):
+    monkeypatch.setattr(cache, 'backend', MemoryBackend())
+    venue = Venue(name='Old Hall', city='San Francisco', state='CA',
+                  address='1 Main St')
+    artist = Artist(name='Artist', city='San Francisco', state='CA')
+    db.session.add(Show(venue=venue, artist=artist,
+                        starttime=datetime.now() + timedelta(days=1)))
+    db.session.commit()
+    refresh_all_show_stats()
+    ids = venue.id, artist.id
+    db.session.remove()
+    return ids
+
+
+def test_venue_edit_invalidates_the_pages_of_its_artists(client, show):
+    venue_id, artist_id = show
+    assert b'Old Hall' in client.get(f'/artists/{artist_id}').data
+    version = tuple(Artist.get_version(artist_id))
+    assert cache.get(f'artist:{artist_id}', 'detail', version)[0]
+
+    client.post(f'/venues/{venue_id}/edit', data={'name': 'New Hall'})
+
+    # gone whatever its version, not just superseded by a newer one
+    assert not cache.get(f'artist:{artist_id}', 'detail', version)[0]
+    response = client.get(f'/artists/{artist_id}')
+    assert b'New Hall' in response.data
+    assert b'Old Hall' not in response.data
+
+
+class RecordingBackend(MemoryBackend):
+
+    def __init__(self):
+        super().__init__()
+        self.ttls = {}
+
+    def set(self, key, value, ttl=None):
+        self.ttls[key] = ttl
+        super().set(key, value, ttl)
+
+    def ttl_of(self, namespace):
+        # keys are namespace:namespace version:key
+        return next(ttl for key, ttl in self.ttls.items()
+                    if key.startswith(namespace + ':')
+                    and not key.startswith('ns:'))
+
+
+def test_entries_expire_when_the_next_show_starts(app, client,
+                                                  monkeypatch):
+    backend = RecordingBackend()
+    monkeypatch.setattr(cache, 'backend', backend)
+    now = datetime.now()
+    venue = Venue(name='Hall', city='San Francisco', state='CA',
+                  address='1 Main St')
+    other = Venue(name='Club', city='San Francisco', state='CA',
+                  address='2 Main St')
+    artist = Artist(name='Artist', city='San Francisco', state='CA')
+    for show_venue, delta in [(venue, -timedelta(hours=1)),
+                              (venue, timedelta(seconds=90)),
+                              (venue, timedelta(days=1)),
+                              (other, timedelta(seconds=60))]:
+        db.session.add(Show(venue=show_venue, artist=artist,
+                            starttime=now + delta))
+    db.session.commit()
+    venue_id = venue.id
+    db.session.remove()
+
+    client.get(f'/venues/{venue_id}')
+    client.get('/shows?upcoming=1')
+    # the venue's first upcoming show, and the first show of all
+    assert backend.ttl_of(f'venue:{venue_id}') == \
+        pytest.approx(90, abs=2)
+    assert backend.ttl_of('shows') == pytest.approx(60, abs=2)
@@ -0,0 +1,44 @@
+import pytest
+
+from app.app import cache, db
+from app.cache import MemoryBackend
+from app.models import Venue
+
+
+@pytest.fixture
+def venue(app, monkeypatch):
+    monkeypatch.setattr(cache, 'backend', MemoryBackend())
+    venue = Venue(name='Old Name', city='San Francisco', state='CA',
+                  address='1 Main St')
+    db.session.add(venue)
+    db.session.commit()
+    return venue
+
+
+def test_cached_page_is_not_served_under_a_newer_etag(client, venue):
+    first = client.get(f'/venues/{venue.id}')
+    assert b'Old Name' in first.data
+
+    # written by another process, so this one's cache isn't invalidated
+    venue.name = 'New Name'
+    db.session.commit()
+
+    second = client.get(f'/venues/{venue.id}',
+                        headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert second.headers['ETag'] != first.headers['ETag']
+    assert b'New Name' in second.data
+
+
+def test_listing_etag_follows_writes(client, venue):
+    first = client.get('/venues')
+    etag = first.headers['ETag']
+    assert client.get('/venues', headers={'If-None-Match': etag}) \
+        .status_code == 304
+
+    venue.name = 'New Name'
+    db.session.commit()
+
+    second = client.get('/venues', headers={'If-None-Match': etag})
+    assert second.status_code == 200
+    assert b'New Name' in second.data
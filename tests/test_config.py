@@ -0,0 +1,34 @@
+import importlib
+
+import pytest
+
+import app.config
+
+
+def load_config(name):
+    # config modules read the environment when they are imported
+    importlib.reload(app.config)
+    module = importlib.import_module(name)
+    return importlib.reload(module)
+
+
+@pytest.fixture(autouse=True)
+def environ(monkeypatch):
+    for name in ('FLASK_DEBUG', 'FLASK_ENV'):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv('SECRET_KEY', 'test')
+    yield
+    monkeypatch.undo()
+    importlib.reload(app.config)
+
+
+def test_debug_is_off_by_default():
+    assert load_config('app.config').DEBUG is False
+
+
+@pytest.mark.parametrize('name, value', [('FLASK_DEBUG', '1'),
+                                         ('FLASK_ENV', 'development')])
+def test_production_config_never_debugs(monkeypatch, name, value):
+    monkeypatch.setenv(name, value)
+    assert load_config('app.config').DEBUG is True
+    assert load_config('app.config_production').DEBUG is False
@@ -0,0 +1,22 @@
+from datetime import datetime, timedelta
+
+from app.app import db
+from app.models import Artist, Show, Venue
+
+
+def test_tiles_follow_changes_made_elsewhere(client):
+    venue = Venue(name='Venue', city='San Francisco', state='CA',
+                  address='1 Main St')
+    artist = Artist(name='Old Name', city='San Francisco', state='CA')
+    db.session.add(Show(venue=venue, artist=artist,
+                        starttime=datetime.now() + timedelta(days=1)))
+    db.session.commit()
+    for path in ('/artists', '/shows'):
+        assert b'Old Name' in client.get(path).data
+
+    # written by another process: nothing here is invalidated
+    artist.name = 'New Name'
+    db.session.commit()
+    for path in ('/artists', '/shows'):
+        data = client.get(path).data
+        assert b'New Name' in data and b'Old Name' not in data
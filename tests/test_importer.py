@@ -0,0 +1,16 @@
+from app.app import db
+from app.importer import sync_entities
+from app.models import Venue
+
+
+def test_sync_leaves_unchanged_rows_alone(app):
+    # created through the form, which stores empty fields as ''
+    db.session.add(Venue(name='Venue', city='San Francisco', state='CA',
+                         address='1 Main St', phone='', website='',
+                         seeking_talent=None))
+    db.session.commit()
+    record = {'name': 'Venue', 'city': 'San Francisco', 'state': 'CA',
+              'address': '1 Main St', 'phone': '', 'seeking_talent': ''}
+
+    counts, _, _ = sync_entities('venues', [record], report=lambda _: None)
+    assert counts == {'inserted': 0, 'updated': 0, 'deleted': 0}
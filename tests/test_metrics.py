@@ -0,0 +1,48 @@
+import threading
+
+from app.app import metrics
+from app.metrics import ShardedCounters
+from tests.test_venues import add_venues
+
+
+def test_shards_of_exited_threads_are_folded():
+    counters = ShardedCounters()
+
+    def request():
+        counters.inc('http_requests_total')
+        counters.observe('http_request_duration_seconds', (), 0.01)
+
+    # the development server handles each request on a new thread
+    for _ in range(50):
+        thread = threading.Thread(target=request)
+        thread.start()
+        thread.join()
+    counters.inc('http_requests_total')
+
+    assert len(counters._shards) == 1
+    totals = counters.collect()
+    assert totals['http_requests_total', ()] == 51
+    assert totals['http_request_duration_seconds_count', ()] == 50
+
+
+def test_streamed_pages_are_timed_until_sent(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'STREAM_TEMPLATES', True)
+    add_venues(3)
+    labels = (('endpoint', 'venues'),)
+    before = metrics.counters.collect()
+
+    response = client.get('/venues')
+    assert response.is_streamed
+    assert metrics.counters.collect()[
+        'http_request_duration_seconds_count', labels] == \
+        before['http_request_duration_seconds_count', labels]
+    response.close()
+
+    after = metrics.counters.collect()
+    duration = after['http_request_duration_seconds_sum', labels] - \
+        before['http_request_duration_seconds_sum', labels]
+    db_time = after['db_statement_seconds_total', labels] - \
+        before['db_statement_seconds_total', labels]
+    assert after['http_request_duration_seconds_count', labels] == \
+        before['http_request_duration_seconds_count', labels] + 1
+    assert duration > db_time > 0
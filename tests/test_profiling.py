@@ -0,0 +1,18 @@
+from app.app import profiler
+from tests.test_venues import add_venues
+
+
+def test_streamed_pages_are_profiled(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'STREAM_TEMPLATES', True)
+    add_venues(3)
+    before = profiler.stats().get('venues', {}).get('statements', {})
+
+    response = client.get('/venues')
+    assert response.is_streamed
+    assert b'Venue 3-2' in response.data
+    response.close()
+
+    stats = profiler.stats()['venues']
+    assert stats['statements']['count'] == before.get('count', 0) + 1
+    assert stats['statements']['sum'] > before.get('sum', 0)
+    assert stats['template_time']['sum'] > 0
@@ -0,0 +1,80 @@
+import os
+
+import pytest
+from sqlalchemy import event
+
+from app.app import cache, db
+from app.cache import MemoryBackend
+from app.models import Venue
+
+
+@pytest.fixture
+def replica(app, tmp_path, monkeypatch):
+    url = f'sqlite:///{tmp_path / "replica.db"}'
+    monkeypatch.setitem(app.config, 'SQLALCHEMY_BINDS', {'replica0': url})
+    monkeypatch.setitem(app.config, 'REPLICA_BINDS', ['replica0'])
+    engine = db.get_engine(app, 'replica0')
+    db.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+    os.remove(tmp_path / 'replica.db')
+
+
+def executed_on(engine):
+    statements = []
+    event.listen(engine, 'before_cursor_execute',
+                 lambda *args: statements.append(args[2]))
+    return statements
+
+
+def test_health_check_queries_the_primary(client, replica):
+    on_primary = executed_on(db.engine)
+    on_replica = executed_on(replica)
+    assert client.get('/health/db').json['healthy']
+    assert on_primary == ['SELECT 1']
+    assert on_replica == []
+
+
+def replicate(engine):
+    with engine.begin() as connection:
+        for table in reversed(db.metadata.sorted_tables):
+            connection.execute(table.delete())
+        for table in db.metadata.sorted_tables:
+            rows = [dict(row) for row in db.engine.execute(table.select())]
+            if rows:
+                connection.execute(table.insert(), rows)
+
+
+def test_page_cache_is_filled_from_the_replica(client, replica,
+                                               monkeypatch):
+    monkeypatch.setattr(cache, 'backend', MemoryBackend())
+    venue = Venue(name='Old Name', city='San Francisco', state='CA',
+                  address='1 Main St')
+    db.session.add(venue)
+    db.session.commit()
+    venue_id = venue.id
+    db.session.remove()
+    replicate(replica)
+
+    on_primary = executed_on(db.engine)
+    assert b'Old Name' in client.get(f'/venues/{venue_id}').data
+    assert on_primary == []
+
+    Venue.query.get(venue_id).name = 'New Name'
+    db.session.commit()
+    db.session.remove()
+    # until the replica catches up, its version and data agree
+    assert b'Old Name' in client.get(f'/venues/{venue_id}').data
+    replicate(replica)
+    assert b'New Name' in client.get(f'/venues/{venue_id}').data
+
+
+def test_search_reads_from_a_replica_without_sticking(client, replica):
+    on_primary = executed_on(db.engine)
+    on_replica = executed_on(replica)
+    response = client.post('/venues/search', data={'search_term': 'Hall'})
+    assert response.status_code == 200
+    assert on_primary == []
+    assert on_replica
+    with client.session_transaction() as session:
+        assert 'primary_until' not in session
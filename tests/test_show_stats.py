@@ -0,0 +1,30 @@
+from datetime import datetime, timedelta
+
+from app.app import cache, db
+from app.models import Artist, EntityShowStats, Show, Venue, \
+                       refresh_all_show_stats
+
+
+def test_refresh_command_invalidates_refreshed_pages(app, monkeypatch):
+    venue = Venue(name='Venue', city='San Francisco', state='CA',
+                  address='1 Main St')
+    artist = Artist(name='Artist', city='San Francisco', state='CA')
+    db.session.add(Show(venue=venue, artist=artist,
+                        starttime=datetime.now() - timedelta(minutes=1)))
+    db.session.commit()
+    venue_id, artist_id = venue.id, artist.id
+    refresh_all_show_stats()
+    # as if the show had started since the last refresh
+    EntityShowStats.query.update({
+        'upcoming_count': 1, 'past_count': 0,
+        'next_show': datetime.now() - timedelta(minutes=1)})
+    db.session.commit()
+
+    invalidated = []
+    monkeypatch.setattr(cache, 'invalidate',
+                        lambda *namespaces: invalidated.extend(namespaces))
+    result = app.test_cli_runner().invoke(args=['refresh-show-stats'])
+    assert 'refreshed 2 show stats' in result.output
+    assert {'venues', 'artists', f'venue:{venue_id}',
+            f'artist:{artist_id}'} <= set(invalidated)
+    assert Venue.query.get(venue_id).num_past_shows == 1
@@ -0,0 +1,24 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.app import db
+from app.models import Artist, Show, Venue
+
+
+@pytest.fixture
+def shows(app):
+    venue = Venue(name='Venue', city='San Francisco', state='CA',
+                  address='1 Main St')
+    artist = Artist(name='Artist', city='San Francisco', state='CA')
+    for days in (-2, -1, 1):
+        db.session.add(Show(venue=venue, artist=artist,
+                            starttime=datetime.now() + timedelta(days=days)))
+    db.session.commit()
+
+
+@pytest.mark.parametrize('value, count', [
+    ('', 3), ('0', 3), ('false', 3), ('1', 1), ('true', 1), ('Yes', 1)])
+def test_upcoming_filter(client, shows, value, count):
+    response = client.get(f'/api/v1/shows?upcoming={value}')
+    assert len(response.json['data']) == count
@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta
+
+from app.app import db
+from app.models import Artist, Show, Venue, refresh_all_show_stats
+
+
+def add_venues(count):
+    artist = Artist(name=f'Artist {count}', city='San Francisco',
+                    state='CA')
+    for i in range(count):
+        venue = Venue(name=f'Venue {count}-{i}', city=f'City {i % 3}',
+                      state=['CA', 'NY'][i % 2], address='1 Main St')
+        db.session.add(venue)
+        db.session.add(Show(venue=venue, artist=artist,
+                            starttime=datetime.now() + timedelta(days=i)))
+    db.session.commit()
+    refresh_all_show_stats()
+    db.session.commit()
+
+
+def test_venue_directory_query_count_is_constant(client, statements):
+    add_venues(2)
+    del statements[:]
+    assert client.get('/venues').status_code == 200
+    few = len(statements)
+    # the catalog version, the directory itself and the cache expiry
+    assert few <= 3
+
+    add_venues(12)
+    del statements[:]
+    response = client.get('/venues')
+    assert response.status_code == 200
+    assert b'Venue 12-11' in response.data
+    assert len(statements) == few